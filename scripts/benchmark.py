@@ -0,0 +1,245 @@
+import argparse
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import LineString
+
+from src.data.synthetic import SYNTHETIC_CRS
+from src.model.model import AgentsAndNetworks
+from src.space.road_network import RoadNetwork
+
+CAMPUS_PARAMS = {
+    "ub": {"data_crs": "epsg:4326", "data_file_prefix": "UB"},
+    "gmu": {"data_crs": "epsg:2283", "data_file_prefix": "Mason"},
+}
+
+
+def get_campus_files(campus: str) -> dict:
+    """
+    Data CRS and buildings and walkway files of a bundled campus, or of a synthetic one made by
+    scripts/make_synthetic_campus.py.
+    """
+    if campus in CAMPUS_PARAMS:
+        prefix = CAMPUS_PARAMS[campus]["data_file_prefix"]
+        return {
+            "data_crs": CAMPUS_PARAMS[campus]["data_crs"],
+            "buildings_file": f"data/raw/{campus}/{prefix}_bld.shp",
+            "walkway_file": f"data/raw/{campus}/{prefix}_walkway_line.shp",
+        }
+    return {
+        "data_crs": SYNTHETIC_CRS,
+        "buildings_file": f"data/processed/{campus}/{campus}_bld.shp",
+        "walkway_file": f"data/processed/{campus}/{campus}_walkway_line.shp",
+    }
+
+
+def load_walkway(campus: str, model_crs="epsg:3857") -> gpd.GeoSeries:
+    campus_files = get_campus_files(campus)
+    return (
+        gpd.read_file(campus_files["walkway_file"])
+        .set_crs(campus_files["data_crs"], allow_override=True)
+        .to_crs(model_crs)["geometry"]
+    )
+
+
+def benchmark_routing(
+    campus: str, num_queries: int, num_entrances: int, seed: int
+) -> None:
+    walkway = load_walkway(campus)
+    for simplify in (False, True):
+        start = time.perf_counter()
+        road_network = RoadNetwork(walkway, simplify=simplify)
+        build_time = time.perf_counter() - start
+
+        # like building entrances in the model, query endpoints are a fixed set of pinned road vertices
+        rng = random.Random(seed)
+        num_vertices = len(road_network.node_coords)
+        entrances = [rng.randrange(num_vertices) for _ in range(num_entrances)]
+        road_network.pin_nodes(entrances)
+        queries = [
+            (rng.choice(entrances), rng.choice(entrances)) for _ in range(num_queries)
+        ]
+        start = time.perf_counter()
+        for source, target in queries:
+            road_network.get_shortest_path(source, target)
+        query_time = time.perf_counter() - start
+
+        print(
+            f"{campus} simplify={simplify}: "
+            f"{road_network.nx_graph.number_of_nodes()} nodes, "
+            f"{road_network.nx_graph.number_of_edges()} edges, "
+            f"built in {build_time:.3f}s, "
+            f"{num_queries} queries in {query_time:.3f}s "
+            f"({1000 * query_time / num_queries:.2f}ms per query)"
+        )
+
+
+def tile(gdf: gpd.GeoDataFrame, scale: int, connect: bool = False) -> gpd.GeoDataFrame:
+    """
+    Make a layer about `scale` times larger by repeating gdf on a square grid of translated copies.
+
+    The copies are spaced apart, so that they do not overlap. If connect, gdf is a walkway, and each copy is joined to
+    its right and upper neighbors by a segment between the outermost vertices of the road network, so that the copies
+    make one connected road network rather than many, of which only the largest would be kept.
+    """
+    n = math.ceil(math.sqrt(scale))
+    x_min, y_min, x_max, y_max = gdf.total_bounds
+    width, height = x_max - x_min, y_max - y_min
+    offsets = [
+        np.array([(i % n) * width * 1.1, (i // n) * height * 1.1]) for i in range(n * n)
+    ]
+    copies = []
+    for offset in offsets:
+        copy = gdf.copy()
+        copy["geometry"] = shapely.transform(
+            gdf.geometry.values, lambda coords: coords + offset
+        )
+        copies.append(copy)
+    if connect:
+        node_coords = RoadNetwork(gdf.geometry).node_coords
+        left, right = (
+            node_coords[node_coords[:, 0].argmin()],
+            node_coords[node_coords[:, 0].argmax()],
+        )
+        bottom, top = (
+            node_coords[node_coords[:, 1].argmin()],
+            node_coords[node_coords[:, 1].argmax()],
+        )
+        connectors = []
+        for i, offset in enumerate(offsets):
+            if i % n + 1 < n:
+                connectors.append(LineString([right + offset, left + offsets[i + 1]]))
+            if i // n + 1 < n:
+                connectors.append(LineString([top + offset, bottom + offsets[i + n]]))
+        copies.append(gpd.GeoDataFrame(geometry=connectors, crs=gdf.crs))
+    return gpd.GeoDataFrame(
+        pd.concat(copies, ignore_index=True), geometry="geometry", crs=gdf.crs
+    )
+
+
+def benchmark_ingest(campus: str, scale: int) -> None:
+    campus_files = get_campus_files(campus)
+    files = {name: campus_files[name] for name in ("buildings_file", "walkway_file")}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if scale > 1:
+            for name, file in files.items():
+                files[name] = os.path.join(tmp_dir, f"{name}.shp")
+                tile(
+                    gpd.read_file(file), scale, connect=name == "walkway_file"
+                ).to_file(files[name])
+        start = time.perf_counter()
+        model = AgentsAndNetworks(
+            campus=campus,
+            data_crs=campus_files["data_crs"],
+            buildings_file=files["buildings_file"],
+            walkway_file=files["walkway_file"],
+            lakes_file=None,
+            rivers_file=None,
+            driveway_file=None,
+            num_commuters=0,
+        )
+        ingest_time = time.perf_counter() - start
+    num_buildings = len(
+        model.space.homes + model.space.works + model.space.other_buildings
+    )
+    print(
+        f"{campus} x{scale}: {num_buildings} buildings, "
+        f"{model.walkway.nx_graph.number_of_edges()} routing edges, "
+        f"ingested in {ingest_time:.3f}s"
+    )
+
+
+HEAVY_MODULES = ("sklearn", "matplotlib", "seaborn", "tornado")
+
+
+def benchmark_imports(modules) -> None:
+    """
+    Time the import of each module in a fresh interpreter, like in a newly spawned worker process, and list the
+    heavy optional dependencies that it pulls in.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import {module}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(' '.join(m for m in {HEAVY_MODULES} if m in sys.modules))\n"
+    )
+    for module in modules:
+        output = subprocess.run(
+            [sys.executable, "-c", code.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        print(
+            f"import {module}: {float(output[0]):.3f}s, "
+            f"heavy dependencies loaded: {output[1] if len(output) > 1 and output[1] else 'none'}"
+        )
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Agents and Networks in Python benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    routing_parser = subparsers.add_parser(
+        "routing", help="routing graph size and shortest path query times"
+    )
+    routing_parser.add_argument(
+        "--campus",
+        type=str,
+        default="ub",
+        help="ub, gmu, or the name of a generated synthetic campus",
+    )
+    routing_parser.add_argument("--num-queries", type=int, default=200)
+    routing_parser.add_argument("--num-entrances", type=int, default=100)
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="cold start time of loading buildings and walkways"
+    )
+    ingest_parser.add_argument(
+        "--campus",
+        type=str,
+        default="ub",
+        help="ub, gmu, or the name of a generated synthetic campus",
+    )
+    ingest_parser.add_argument(
+        "--scale",
+        type=int,
+        default=1,
+        help="tile the campus layers to make them about this many times larger",
+    )
+
+    imports_parser = subparsers.add_parser(
+        "imports", help="cold import times of the package modules"
+    )
+    imports_parser.add_argument(
+        "modules",
+        nargs="*",
+        default=[
+            "src.model.model",
+            "src.model.runner",
+            "src.visualization.utils",
+            "src.visualization.server",
+        ],
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = make_parser().parse_args()
+    if args.benchmark == "routing":
+        benchmark_routing(args.campus, args.num_queries, args.num_entrances, args.seed)
+    elif args.benchmark == "ingest":
+        benchmark_ingest(args.campus, args.scale)
+    elif args.benchmark == "imports":
+        benchmark_imports(args.modules)
@@ -0,0 +1,40 @@
+import argparse
+import os
+
+from src.data.synthetic import (
+    LAYOUTS,
+    SYNTHETIC_CAMPUS_PREFIX,
+    make_synthetic_campus,
+)
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Synthetic campus generator")
+    parser.add_argument("--num-buildings", type=int, default=1000)
+    parser.add_argument("--num-segments", type=int, default=10000)
+    parser.add_argument("--layout", type=str, choices=LAYOUTS, default="grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", type=str, default="data/processed")
+    return parser
+
+
+if __name__ == "__main__":
+    args = make_parser().parse_args()
+
+    campus = (
+        f"{SYNTHETIC_CAMPUS_PREFIX}_{args.layout}_{args.num_buildings}"
+        f"_{args.num_segments}_{args.seed}"
+    )
+    buildings_df, walkway_df = make_synthetic_campus(
+        num_buildings=args.num_buildings,
+        num_segments=args.num_segments,
+        layout=args.layout,
+        seed=args.seed,
+    )
+    campus_dir = os.path.join(args.output_dir, campus)
+    os.makedirs(campus_dir, exist_ok=True)
+    buildings_df.to_file(os.path.join(campus_dir, f"{campus}_bld.shp"))
+    walkway_df.to_file(os.path.join(campus_dir, f"{campus}_walkway_line.shp"))
+    print(
+        f"{len(buildings_df)} buildings and {len(walkway_df)} walkway lines written to {campus_dir}"
+    )
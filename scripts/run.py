@@ -1,23 +1,141 @@
 import argparse
 
-import mesa
-import mesa_geo as mg
-
 from src.model.model import AgentsAndNetworks
-from src.visualization.server import (
-    agent_draw,
-    clock_element,
-    status_chart,
-    friendship_chart,
-)
 
 
 def make_parser():
     parser = argparse.ArgumentParser("Agents and Networks in Python")
     parser.add_argument("--campus", type=str, required=True)
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        help="step the model in a background thread instead of once per browser frame",
+    )
+    parser.add_argument(
+        "--tps",
+        type=float,
+        default=None,
+        help="target ticks per second in background mode (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--broadcast",
+        action="store_true",
+        help="show one simulation, stepped in the background, to all viewers instead of letting each of them step it",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=3.0,
+        help="frames per second pushed to viewers in broadcast mode",
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="run the model without visualization, for --steps steps",
+    )
+    parser.add_argument("--steps", type=int, default=288)
+    parser.add_argument(
+        "--route-prefetch-workers",
+        type=int,
+        default=None,
+        help="compute the routes of upcoming trips ahead of time on this many worker processes",
+    )
+    parser.add_argument(
+        "--num-commuters",
+        type=int,
+        default=50,
+        help="number of commuters of a headless run, or initial value of the slider on the server",
+    )
     return parser
 
 
+def launch_server(
+    model_params, campus_params, num_commuters, background, tps, broadcast, fps
+):
+    # the visualization stack is only imported when it is used
+    import mesa
+
+    from src.visualization.server import (
+        agent_draw,
+        BackgroundModularServer,
+        BroadcastModularServer,
+        DensityMapModule,
+        clock_element,
+        status_chart,
+        friendship_chart,
+    )
+
+    model_params = {
+        **model_params,
+        "show_walkway": True,
+        "show_lakes_and_rivers": True,
+        "show_driveway": True,
+        # up to well beyond the thousand commuters from which the map shows a density image
+        "num_commuters": mesa.visualization.Slider(
+            "Number of Commuters",
+            value=num_commuters,
+            min_value=10,
+            max_value=max(5000, num_commuters),
+            step=10,
+        ),
+        "commuter_speed": mesa.visualization.Slider(
+            "Commuter Walking Speed (m/s)",
+            value=campus_params["commuter_speed"],
+            min_value=0.1,
+            max_value=1.5,
+            step=0.1,
+        ),
+    }
+    # commuters are drawn one by one up to a thousand, and as a density image beyond
+    map_element = DensityMapModule(agent_draw, map_height=600, map_width=600)
+    visualization_elements = [
+        map_element,
+        clock_element,
+        status_chart,
+        friendship_chart,
+    ]
+    if broadcast:
+        server = BroadcastModularServer(
+            AgentsAndNetworks,
+            visualization_elements,
+            "Agents and Networks",
+            model_params,
+            ticks_per_second=tps,
+            frames_per_second=fps,
+        )
+    elif background:
+        server = BackgroundModularServer(
+            AgentsAndNetworks,
+            visualization_elements,
+            "Agents and Networks",
+            model_params,
+            ticks_per_second=tps,
+        )
+    else:
+        server = mesa.visualization.ModularServer(
+            AgentsAndNetworks,
+            visualization_elements,
+            "Agents and Networks",
+            model_params,
+        )
+    server.launch()
+
+
+def run_headless(model_params, campus_params, num_commuters, steps):
+    model = AgentsAndNetworks(
+        **model_params,
+        num_commuters=num_commuters,
+        commuter_speed=campus_params["commuter_speed"],
+        # nobody looks at commuters on their way, so only their arrival times are computed
+        track_positions=False,
+    )
+    for _ in range(steps):
+        if not model.running:
+            break
+        model.step()
+    print(model.datacollector.get_model_vars_dataframe().tail(1).to_string())
+
+
 if __name__ == "__main__":
     args = make_parser().parse_args()
 
@@ -40,25 +158,19 @@ if __name__ == "__main__":
         "lakes_file": f"data/raw/{args.campus}/hydrop.shp",
         "rivers_file": f"data/raw/{args.campus}/hydrol.shp",
         "driveway_file": f"data/raw/{args.campus}/{data_file_prefix}_Rds.shp",
-        "show_walkway": True,
-        "show_lakes_and_rivers": True,
-        "show_driveway": True,
-        "num_commuters": mesa.visualization.Slider(
-            "Number of Commuters", value=50, min_value=10, max_value=150, step=10
-        ),
-        "commuter_speed": mesa.visualization.Slider(
-            "Commuter Walking Speed (m/s)",
-            value=campus_params[args.campus]["commuter_speed"],
-            min_value=0.1,
-            max_value=1.5,
-            step=0.1,
-        ),
+        "route_prefetch_workers": args.route_prefetch_workers,
     }
-    map_element = mg.visualization.MapModule(agent_draw, map_height=600, map_width=600)
-    server = mesa.visualization.ModularServer(
-        AgentsAndNetworks,
-        [map_element, clock_element, status_chart, friendship_chart],
-        "Agents and Networks",
-        model_params,
-    )
-    server.launch()
+    if args.headless:
+        run_headless(
+            model_params, campus_params[args.campus], args.num_commuters, args.steps
+        )
+    else:
+        launch_server(
+            model_params,
+            campus_params[args.campus],
+            args.num_commuters,
+            args.background,
+            args.tps,
+            args.broadcast,
+            args.fps,
+        )
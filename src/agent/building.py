@@ -17,7 +17,7 @@ class Building(mg.GeoAgent):
     centroid: mesa.space.FloatCoordinate
     name: str
     function: float  # 1.0 for work, 2.0 for home, 0.0 for neither
-    entrance_pos: mesa.space.FloatCoordinate  # nearest vertex on road
+    entrance_id: int  # id of the nearest vertex on road
 
     def __init__(self, unique_id, model, geometry, crs) -> None:
         super().__init__(unique_id=unique_id, model=model, geometry=geometry, crs=crs)
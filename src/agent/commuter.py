@@ -1,16 +1,17 @@
 from __future__ import annotations
 
 import random
-from typing import List
+from typing import List, Optional
 
 import pyproj
 import numpy as np
 import mesa
 import mesa_geo as mg
+import networkx as nx
 from shapely.geometry import Point, LineString
 
 from src.agent.building import Building
-from src.space.utils import redistribute_vertices, UnitTransformer
+from src.space.utils import get_path_positions, UnitTransformer
 
 
 class Commuter(mg.GeoAgent):
@@ -20,10 +21,13 @@ class Commuter(mg.GeoAgent):
     crs: pyproj.CRS
     origin: Building  # where he begins his trip
     destination: Building  # the destination he wants to arrive at
-    my_path: List[
-        mesa.space.FloatCoordinate
-    ]  # a set containing nodes to visit in the shortest path
+    my_path: np.ndarray  # ids of the road vertices of the shortest path, as int32
+    # positions to visit along the path, one per step: (num_steps, 2)
+    my_path_positions: np.ndarray
     step_in_path: int  # the number of step taking in the walk
+    departure_step: int  # schedule step at which the current trip started
+    arrival_step: int  # schedule step at which the current trip ends, if positions are not tracked
+    _is_path_redistributed: bool
     my_home: Building
     my_work: Building
     start_time_h: int  # time to start going to work, hour and minute
@@ -64,18 +68,18 @@ class Commuter(mg.GeoAgent):
 
     @property
     def num_home_friends(self) -> int:
-        return self.model.space.home_counter[self.my_home.centroid]
+        return self.model.space.home_counter[self.my_home.unique_id]
 
     @property
     def num_work_friends(self) -> int:
         return len(self.work_friends_id)
 
     def set_home(self, new_home: Building) -> None:
-        old_home_pos = self.my_home.centroid if self.my_home else None
+        old_home_id = self.my_home.unique_id if self.my_home else None
         self.my_home = new_home
         self.happiness_home = 100.0
         self.model.space.update_home_counter(
-            old_home_pos=old_home_pos, new_home_pos=self.my_home.centroid
+            old_home_id=old_home_id, new_home_id=self.my_home.unique_id
         )
 
     def set_work(self, new_work: Building) -> None:
@@ -127,12 +131,11 @@ class Commuter(mg.GeoAgent):
             and self.model.minute == self.start_time_m
         ):
             self.origin = self.model.space.get_building_by_id(self.my_home.unique_id)
-            self.model.space.move_commuter(self, pos=self.origin.centroid)
+            self.model.space.move_commuter_to_building(self, self.origin)
             self.destination = self.model.space.get_building_by_id(
                 self.my_work.unique_id
             )
-            self._path_select()
-            self.status = "transport"
+            self._start_trip()
         # start going home
         elif (
             self.status == "work"
@@ -140,87 +143,180 @@ class Commuter(mg.GeoAgent):
             and self.model.minute == self.end_time_m
         ):
             self.origin = self.model.space.get_building_by_id(self.my_work.unique_id)
-            self.model.space.move_commuter(self, pos=self.origin.centroid)
+            self.model.space.move_commuter_to_building(self, self.origin)
             self.destination = self.model.space.get_building_by_id(
                 self.my_home.unique_id
             )
+            self._start_trip()
+
+    def _start_trip(self) -> None:
+        try:
             self._path_select()
-            self.status = "transport"
+        except nx.NetworkXNoPath:
+            # the destination has been cut off by road closures: stay, and try again at the next departure time
+            self.model.trips_without_route += 1
+            return
+        self.status = "transport"
 
     def _move(self) -> None:
         if self.status == "transport":
-            if self.step_in_path < len(self.my_path):
-                next_position = self.my_path[self.step_in_path]
-                self.model.space.move_commuter(self, next_position)
-                self.step_in_path += 1
-            else:
-                self.model.space.move_commuter(self, self.destination.centroid)
-                if self.destination == self.my_work:
-                    self.status = "work"
-                elif self.destination == self.my_home:
-                    self.status = "home"
-                self.model.got_to_destination += 1
+            if self.model.track_positions:
+                if self.step_in_path < len(self.my_path_positions):
+                    next_position = self.my_path_positions[self.step_in_path]
+                    self.model.space.move_commuter(self, next_position)
+                    self.step_in_path += 1
+                    return
+            elif self.model.schedule.steps < self.arrival_step:
+                if self.model.schedule.steps == self.departure_step:
+                    # leave the origin building, so that commuters still there no longer find this one
+                    self.model.space.move_commuter(
+                        self, self.model.walkway.node_coords[self.my_path[0]]
+                    )
+                return
+            self.model.space.move_commuter_to_building(self, self.destination)
+            if self.destination == self.my_work:
+                self.status = "work"
+            elif self.destination == self.my_home:
+                self.status = "home"
+            self.model.got_to_destination += 1
+
+    def sync_position(self) -> None:
+        """
+        Place a commuter in transport where it would be if its position were tracked on every tick.
+
+        Only needed when the model does not track positions, and only when a viewer or a spatial query asks for them.
+        """
+        if self.model.track_positions or self.status != "transport":
+            return
+        if not self._is_path_redistributed:
+            self._redistribute_path_vertices()
+            self._is_path_redistributed = True
+        self.step_in_path = min(
+            self.model.schedule.steps - self.departure_step,
+            len(self.my_path_positions),
+        )
+        if self.step_in_path > 0:
+            self.model.space.move_commuter(
+                self, self.my_path_positions[self.step_in_path - 1]
+            )
 
     def advance(self) -> None:
         raise NotImplementedError
 
+    def prefetch_next_route(self) -> None:
+        """
+        Let the model's route prefetcher, if any, compute the route of the next trip in the background.
+        """
+        if (route_prefetcher := self.model.route_prefetcher) is None:
+            return
+        if self.status == "home" or (
+            self.status == "transport" and self.destination == self.my_home
+        ):
+            origin, destination = self.my_home, self.my_work
+        else:
+            origin, destination = self.my_work, self.my_home
+        route_prefetcher.prefetch(
+            origin.entrance_id, destination.entrance_id, step=self.model.schedule.steps
+        )
+
     def _relocate_home(self) -> None:
         while (new_home := self.model.space.get_random_home()) == self.my_home:
             continue
         self.set_home(new_home)
+        self.prefetch_next_route()
 
     def _relocate_work(self) -> None:
         while (new_work := self.model.space.get_random_work()) == self.my_work:
             continue
         self.set_work(new_work)
+        self.prefetch_next_route()
 
     def _path_select(self) -> None:
         self.step_in_path = 0
+        source, target = self.origin.entrance_id, self.destination.entrance_id
+        prefetched_route = (
+            None
+            if self.model.route_prefetcher is None
+            else self.model.route_prefetcher.get_route(source, target)
+        )
         if (
             cached_path := self.model.walkway.get_cached_path(
-                source=self.origin.entrance_pos, target=self.destination.entrance_pos
+                source=source, target=target
             )
         ) is not None:
             self.my_path = cached_path
         else:
-            self.my_path = self.model.walkway.get_shortest_path(
-                source=self.origin.entrance_pos, target=self.destination.entrance_pos
-            )
+            if prefetched_route is not None:
+                self.my_path = prefetched_route[0]
+            else:
+                self.my_path = self.model.walkway.get_shortest_path(
+                    source=source, target=target
+                )
             self.model.walkway.cache_path(
-                source=self.origin.entrance_pos,
-                target=self.destination.entrance_pos,
-                path=self.my_path,
+                source=source, target=target, path=self.my_path
+            )
+        # the cached path may be another one of the same length
+        if prefetched_route is not None and not np.array_equal(
+            prefetched_route[0], self.my_path
+        ):
+            prefetched_route = None
+        self.model.walkway.record_trip(
+            self.my_path, minute_of_day=self.model.hour * 60 + self.model.minute
+        )
+        self.departure_step = self.model.schedule.steps
+        if self.model.track_positions:
+            if prefetched_route is not None and prefetched_route[2] is not None:
+                self.my_path_positions = prefetched_route[2]
+            else:
+                self._redistribute_path_vertices()
+        else:
+            # the commuter takes one tick per vertex of the redistributed path, plus one to get to the destination
+            self._is_path_redistributed = False
+            self.arrival_step = self.departure_step + self._get_num_path_vertices(
+                None if prefetched_route is None else prefetched_route[1]
             )
-        self._redistribute_path_vertices()
+
+    def _get_num_path_vertices(
+        self, path_length_in_meters: Optional[float] = None
+    ) -> int:
+        # the number of vertices that _redistribute_path_vertices would produce, without computing them
+        if len(self.my_path) == 1:
+            return 1
+        if path_length_in_meters is None:
+            path_length_in_meters = self._get_path_in_meters().length
+        num_vert = int(round(path_length_in_meters / self.SPEED))
+        return max(num_vert, 1) + 1
+
+    def _get_path_in_meters(self) -> LineString:
+        unit_transformer = UnitTransformer(degree_crs=self.model.walkway.crs)
+        original_path = LineString(self.model.walkway.node_coords[self.my_path])
+        # from degree unit to meter
+        return unit_transformer.degree2meter(original_path)
 
     def _redistribute_path_vertices(self) -> None:
         # if origin and destination share the same entrance, then self.my_path will contain only this entrance node,
         # and len(self.path) == 1. There is no need to redistribute path vertices.
-        if len(self.my_path) > 1:
+        if len(self.my_path) == 1:
+            self.my_path_positions = self.model.walkway.node_coords[self.my_path]
+        else:
             unit_transformer = UnitTransformer(degree_crs=self.model.walkway.crs)
-            original_path = LineString([Point(p) for p in self.my_path])
-            # from degree unit to meter
-            path_in_meters = unit_transformer.degree2meter(original_path)
-            redistributed_path_in_meters = redistribute_vertices(
-                path_in_meters, self.SPEED
+            self.my_path_positions = get_path_positions(
+                self._get_path_in_meters(), self.SPEED, unit_transformer
             )
-            # meter back to degree
-            redistributed_path_in_degree = unit_transformer.meter2degree(
-                redistributed_path_in_meters
-            )
-            self.my_path = list(redistributed_path_in_degree.coords)
 
     def _make_friends_at_work(self) -> None:
         if self.status == "work":
             for work_friend_id in self.work_friends_id:
                 self.model.space.get_commuter_by_id(work_friend_id).testing = True
-            commuters_to_check = [
-                c
-                for c in self.model.space.get_commuters_by_pos(
-                    (self.geometry.x, self.geometry.y)
-                )
-                if not c.testing
-            ]
+            # sorted, so that the choice below does not depend on the iteration order of a set
+            commuters_to_check = sorted(
+                (
+                    c
+                    for c in self.model.space.get_commuters_in_building_of(self)
+                    if not c.testing
+                ),
+                key=lambda c: c.unique_id,
+            )
             if (
                 commuters_to_check
                 and np.random.uniform(0.0, 100.0) < self.CHANCE_NEW_FRIEND
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+SYNTHETIC_CAMPUS_PREFIX = "synthetic"
+SYNTHETIC_CRS = "epsg:3857"
+LAYOUTS = ("grid", "radial", "random")
+
+
+def make_synthetic_campus(
+    num_buildings: int,
+    num_segments: int,
+    layout: str = "grid",
+    seed: int = 0,
+    block_size: float = 100.0,
+    vertices_per_block: int = 4,
+    function_weights: Tuple[float, float, float] = (0.2, 0.3, 0.5),
+) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """
+    Generate buildings and walkways of a synthetic campus, deterministically for a given seed.
+
+    The walkway network has about num_segments two-point segments, laid out as a grid, as rings and spokes
+    (radial), or as the Delaunay triangulation of random points (random). Its streets are about block_size meters
+    apart, and each of them is split into vertices_per_block segments between two crossings, so that most road
+    vertices have degree 2 like in surveyed data. Buildings are squares placed between the streets, with a function
+    of 0.0 (other), 1.0 (work) or 2.0 (home) drawn with function_weights.
+
+    Both layers are in SYNTHETIC_CRS, with the columns that AgentsAndNetworks loads from the campus shapefiles.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unsupported layout: {layout}. Must be one of {LAYOUTS}.")
+    rng = np.random.default_rng(seed)
+    num_streets = max(num_segments // vertices_per_block, 1)
+    if layout == "grid":
+        streets, lots = _make_grid(num_streets, block_size)
+    elif layout == "radial":
+        streets, lots = _make_radial(num_streets, block_size)
+    else:
+        streets, lots = _make_random(num_streets, block_size, rng)
+    walkway = shapely.segmentize(streets, block_size / vertices_per_block)
+
+    # spread the buildings over the lots, and jitter them within their lot
+    lot_index = rng.choice(
+        len(lots), size=num_buildings, replace=num_buildings > len(lots)
+    )
+    building_size = rng.uniform(0.1, 0.25, size=num_buildings) * block_size
+    centers = (
+        lots[lot_index] + rng.uniform(-0.15, 0.15, size=(num_buildings, 2)) * block_size
+    )
+    buildings = shapely.box(
+        centers[:, 0] - building_size / 2,
+        centers[:, 1] - building_size / 2,
+        centers[:, 0] + building_size / 2,
+        centers[:, 1] + building_size / 2,
+    )
+    function = rng.choice(
+        [0.0, 1.0, 2.0],
+        size=num_buildings,
+        p=np.asarray(function_weights) / np.sum(function_weights),
+    )
+    # commuters need at least one home and one work place
+    function[: min(num_buildings, 2)] = [2.0, 1.0][: min(num_buildings, 2)]
+
+    buildings_df = gpd.GeoDataFrame(
+        {
+            "Id": np.arange(num_buildings),
+            "name": [f"building {i}" for i in range(num_buildings)],
+            "function": function,
+        },
+        geometry=buildings,
+        crs=SYNTHETIC_CRS,
+    )
+    walkway_df = gpd.GeoDataFrame(
+        {"Id": np.arange(len(walkway))}, geometry=walkway, crs=SYNTHETIC_CRS
+    )
+    return buildings_df, walkway_df
+
+
+def _make_grid(num_streets: int, block_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    # n blocks per side take 2 * n * (n + 1) block-long streets
+    n = max(round((-1 + math.sqrt(1 + 2 * num_streets)) / 2), 1)
+    ticks = np.arange(n + 1) * block_size
+    # one street per block side, so that streets end at every crossing like the lines of surveyed data
+    x, y = np.meshgrid(ticks[:-1], ticks)
+    horizontal = np.stack([x, y, x + block_size, y], axis=-1).reshape(-1, 2, 2)
+    vertical = np.stack([y, x, y, x + block_size], axis=-1).reshape(-1, 2, 2)
+    streets = shapely.linestrings(np.concatenate([horizontal, vertical]))
+    centers = (np.arange(n) + 0.5) * block_size
+    lots = np.stack(np.meshgrid(centers, centers), axis=-1).reshape(-1, 2)
+    return streets, lots
+
+
+def _make_radial(num_streets: int, block_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    # with r rings and s = 2 * pi * r spokes, there are about 2 * r * s block-long streets
+    num_rings = max(round(math.sqrt(num_streets / (4 * math.pi))), 1)
+    num_spokes = max(round(2 * math.pi * num_rings), 3)
+    radii = np.arange(1, num_rings + 1) * block_size
+    angles = np.linspace(0.0, 2 * math.pi, num_spokes, endpoint=False)
+    directions = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    # ring r is cut into num_spokes arcs, each approximated by a straight line between two spokes
+    ring_vertices = radii[:, None, None] * directions[None, :, :]
+    arcs = shapely.linestrings(
+        np.stack([ring_vertices, np.roll(ring_vertices, -1, axis=1)], axis=2).reshape(
+            -1, 2, 2
+        )
+    )
+    spoke_vertices = np.concatenate(
+        [np.zeros((1, num_spokes, 2)), ring_vertices], axis=0
+    )
+    spokes = shapely.linestrings(
+        np.stack([spoke_vertices[:-1], spoke_vertices[1:]], axis=2).reshape(-1, 2, 2)
+    )
+    streets = np.concatenate([arcs, spokes])
+    lot_radii = radii - block_size / 2
+    lot_angles = angles + math.pi / num_spokes
+    lots = (
+        lot_radii[:, None, None]
+        * np.stack([np.cos(lot_angles), np.sin(lot_angles)], axis=1)[None, :, :]
+    ).reshape(-1, 2)
+    return streets, lots
+
+
+def _make_random(
+    num_streets: int, block_size: float, rng: np.random.Generator
+) -> Tuple[np.ndarray, np.ndarray]:
+    # a Delaunay triangulation of p points has about 3 * p edges, and 2 * p triangles
+    num_points = max(num_streets // 3, 3)
+    side = math.sqrt(num_points) * block_size
+    points = rng.uniform(0.0, side, size=(num_points, 2))
+    edges = shapely.delaunay_triangles(shapely.multipoints(points), only_edges=True)
+    streets = shapely.get_parts(edges)
+    triangles = shapely.get_parts(
+        shapely.delaunay_triangles(shapely.multipoints(points))
+    )
+    lots = shapely.get_coordinates(shapely.centroid(triangles))
+    return streets, lots
@@ -1,17 +1,28 @@
+import random
 import uuid
+from collections import defaultdict
 from functools import partial
+from typing import DefaultDict, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import mesa
-import mesa_geo as mg
 from shapely.geometry import Point
 
 from src.agent.commuter import Commuter
 from src.agent.geo_agents import Driveway, LakeAndRiver, Walkway
 from src.agent.building import Building
+from src.data.synthetic import SYNTHETIC_CAMPUS_PREFIX
+from src.model.rollup import ROLLUP_BUCKETS, TimeRollup
+from src.model.stopping import DailyConvergence
 from src.space.campus import Campus
 from src.space.road_network import CampusWalkway
+from src.space.route_prefetcher import RoutePrefetcher
+from src.space.utils import create_agents_from_GeoDataFrame, get_centroids
+
+# how long before a departure its route is prefetched
+ROUTE_PREFETCH_LOOKAHEAD_MINUTES = 60
 
 
 def get_time(model) -> pd.Timedelta:
@@ -51,11 +62,21 @@ class AgentsAndNetworks(mesa.Model):
     walkway: CampusWalkway
     world_size: gpd.geodataframe.GeoDataFrame
     got_to_destination: int  # count the total number of arrivals
+    trips_without_route: int  # count the departures that were called off, as road closures cut off the destination
     num_commuters: int
     day: int
     hour: int
     minute: int
     datacollector: mesa.DataCollector
+    rollups: Dict[
+        str, TimeRollup
+    ]  # per-hour and per-day summaries of the collected series
+    convergence: Optional[DailyConvergence]
+    stopping_reason: Optional[str]  # why the model stopped running, if it did
+    track_positions: bool  # if False, commuters in transport are only placed along their path on demand
+    route_prefetcher: Optional[RoutePrefetcher]
+    # commuters by the hour and minute of their departures to work and back home
+    _commuters_by_departure: DefaultDict[Tuple[int, int], List[Commuter]]
 
     def __init__(
         self,
@@ -77,14 +98,29 @@ class AgentsAndNetworks(mesa.Model):
         show_walkway=False,
         show_lakes_and_rivers=False,
         show_driveway=False,
+        max_cached_paths=None,
+        max_path_cache_bytes=None,
+        convergence_tolerance=None,
+        convergence_patience=2,
+        walkway_flow_time_bins=None,
+        seed=None,
+        track_positions=True,
+        route_prefetch_workers=None,
     ) -> None:
+        # mesa seeds self.random from the seed keyword argument; agents also draw from the global generators
         super().__init__()
+        if seed is not None:
+            random.seed(seed)
+            np.random.seed(seed)
         self.schedule = mesa.time.RandomActivation(self)
         self.show_walkway = show_walkway
         self.show_lakes_and_rivers = show_lakes_and_rivers
         self.data_crs = data_crs
         self.space = Campus(crs=model_crs)
         self.num_commuters = num_commuters
+        self.track_positions = track_positions
+        self.max_cached_paths = max_cached_paths
+        self.max_path_cache_bytes = max_path_cache_bytes
 
         Commuter.MIN_FRIENDS = commuter_min_friends
         Commuter.MAX_FRIENDS = commuter_max_friends
@@ -96,7 +132,18 @@ class AgentsAndNetworks(mesa.Model):
         self._load_buildings_from_file(buildings_file, crs=model_crs, campus=campus)
         self._load_road_vertices_from_file(walkway_file, crs=model_crs, campus=campus)
         self._set_building_entrance()
+        if walkway_flow_time_bins is not None:
+            self.walkway.enable_flow_counts(num_time_bins=walkway_flow_time_bins)
+        if route_prefetch_workers is None:
+            self.route_prefetcher = None
+        else:
+            self.route_prefetcher = RoutePrefetcher(
+                self.walkway,
+                speed=Commuter.SPEED if track_positions else None,
+                max_workers=route_prefetch_workers,
+            )
         self.got_to_destination = 0
+        self.trips_without_route = 0
         self._create_commuters()
         self.day = 0
         self.hour = 5
@@ -124,14 +171,47 @@ class AgentsAndNetworks(mesa.Model):
                 ),
             }
         )
-        self.datacollector.collect(self)
+        self.rollups = {
+            resolution: TimeRollup(
+                [name for name in self.datacollector.model_vars if name != "time"],
+                bucket=bucket,
+            )
+            for resolution, bucket in ROLLUP_BUCKETS.items()
+        }
+        self._collect()
+        self.stopping_reason = None
+        if convergence_tolerance is None:
+            self.convergence = None
+        else:
+            self.convergence = DailyConvergence(
+                [
+                    name
+                    for name in self.datacollector.model_vars
+                    if name.startswith(("status_", "friendship_"))
+                ],
+                tolerance=convergence_tolerance,
+                patience=convergence_patience,
+            )
+
+    @staticmethod
+    def get_data_files(model_params: Dict) -> List[str]:
+        """
+        The data files that a model created with these parameters reads; the other "*_file" parameters are unused.
+        """
+        data_files = [model_params["buildings_file"], model_params["walkway_file"]]
+        if model_params.get("show_lakes_and_rivers", False):
+            data_files += [model_params["lakes_file"], model_params["rivers_file"]]
+        if model_params.get("show_driveway", False):
+            data_files.append(model_params["driveway_file"])
+        return data_files
 
     def _create_commuters(self) -> None:
+        self._commuters_by_departure = defaultdict(list)
         for _ in range(self.num_commuters):
             random_home = self.space.get_random_home()
             random_work = self.space.get_random_work()
             commuter = Commuter(
-                unique_id=uuid.uuid4().int,
+                unique_id=uuid.UUID(int=random.getrandbits(128), version=4).int,
                 model=self,
                 geometry=Point(random_home.centroid),
                 crs=self.space.crs,
@@ -139,13 +219,25 @@ class AgentsAndNetworks(mesa.Model):
             commuter.set_home(random_home)
             commuter.set_work(random_work)
             commuter.status = "home"
-            self.space.add_commuter(commuter)
+            self.space.add_commuter(commuter, building=random_home)
             self.schedule.add(commuter)
+            self._commuters_by_departure[
+                (commuter.start_time_h, commuter.start_time_m)
+            ].append(commuter)
+            self._commuters_by_departure[
+                (commuter.end_time_h, commuter.end_time_m)
+            ].append(commuter)
+        if self.route_prefetcher is not None:
+            # the first departures come soon after the start, so prefetch them all, earliest first
+            for commuter in sorted(
+                self.schedule.agents, key=lambda c: (c.start_time_h, c.start_time_m)
+            ):
+                commuter.prefetch_next_route()
 
     def _load_buildings_from_file(
         self, buildings_file: str, crs: str, campus: str
     ) -> None:
-        assert campus in ("ub", "gmu")
+        assert campus in ("ub", "gmu") or campus.startswith(SYNTHETIC_CAMPUS_PREFIX)
 
         buildings_df = gpd.read_file(buildings_file)
         if campus == "gmu":
@@ -156,11 +248,8 @@ class AgentsAndNetworks(mesa.Model):
         buildings_df = buildings_df.set_crs(self.data_crs, allow_override=True).to_crs(
             crs
         )
-        buildings_df["centroid"] = [
-            (x, y) for x, y in zip(buildings_df.centroid.x, buildings_df.centroid.y)
-        ]
-        building_creator = mg.AgentCreator(Building, model=self)
-        buildings = building_creator.from_GeoDataFrame(buildings_df)
+        buildings_df["centroid"] = get_centroids(buildings_df.geometry)
+        buildings = create_agents_from_GeoDataFrame(Building, self, buildings_df)
         self.space.add_buildings(buildings)
 
     def _load_road_vertices_from_file(
@@ -171,10 +260,14 @@ class AgentsAndNetworks(mesa.Model):
             .set_crs(self.data_crs, allow_override=True)
             .to_crs(crs)
         )
-        self.walkway = CampusWalkway(campus=campus, lines=walkway_df["geometry"])
+        self.walkway = CampusWalkway(
+            campus=campus,
+            lines=walkway_df["geometry"],
+            max_cached_paths=self.max_cached_paths,
+            max_path_cache_bytes=self.max_path_cache_bytes,
+        )
         if self.show_walkway:
-            walkway_creator = mg.AgentCreator(Walkway, model=self)
-            walkway = walkway_creator.from_GeoDataFrame(walkway_df)
+            walkway = create_agents_from_GeoDataFrame(Walkway, self, walkway_df)
             self.space.add_agents(walkway)
 
     def _load_driveway_from_file(self, driveway_file: str, crs: str) -> None:
@@ -184,8 +277,7 @@ class AgentsAndNetworks(mesa.Model):
             .set_crs(self.data_crs, allow_override=True)
             .to_crs(crs)
         )
-        driveway_creator = mg.AgentCreator(Driveway, model=self)
-        driveway = driveway_creator.from_GeoDataFrame(driveway_df)
+        driveway = create_agents_from_GeoDataFrame(Driveway, self, driveway_df)
         self.space.add_agents(driveway)
 
     def _load_lakes_and_rivers_from_file(self, lake_river_file: str, crs: str) -> None:
@@ -195,22 +287,68 @@ class AgentsAndNetworks(mesa.Model):
             .to_crs(crs)
         )
         lake_river_df.index.names = ["Id"]
-        lake_river_creator = mg.AgentCreator(LakeAndRiver, model=self)
-        gmu_lake_river = lake_river_creator.from_GeoDataFrame(lake_river_df)
+        gmu_lake_river = create_agents_from_GeoDataFrame(
+            LakeAndRiver, self, lake_river_df
+        )
         self.space.add_agents(gmu_lake_river)
 
     def _set_building_entrance(self) -> None:
-        for building in (
-            *self.space.homes,
-            *self.space.works,
-            *self.space.other_buildings,
-        ):
-            building.entrance_pos = self.walkway.get_nearest_node(building.centroid)
+        buildings = (*self.space.homes, *self.space.works, *self.space.other_buildings)
+        entrances = self.walkway.get_nearest_nodes(
+            building.centroid for building in buildings
+        )
+        for building, entrance_id in zip(buildings, entrances):
+            building.entrance_id = entrance_id
+        # entrances are where all routes start and end, so keep them as nodes of the routing graph
+        self.walkway.pin_nodes(entrances)
 
     def step(self) -> None:
+        day = self.day
         self.__update_clock()
         self.schedule.step()
+        if self.route_prefetcher is not None:
+            self._prefetch_upcoming_routes()
+        self._collect()
+        if (
+            self.day != day
+            and self.convergence is not None
+            and self.convergence.update(self.datacollector)
+        ):
+            self.running = False
+            self.stopping_reason = "converged"
+        if not self.running:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Stop the worker processes of the route prefetcher, if any. A model that is stepped again starts them again.
+        """
+        if self.route_prefetcher is not None:
+            self.route_prefetcher.shutdown()
+
+    def _prefetch_upcoming_routes(self) -> None:
+        self.route_prefetcher.step(self.schedule.steps)
+        minute_of_day = (
+            self.hour * 60 + self.minute + ROUTE_PREFETCH_LOOKAHEAD_MINUTES
+        ) % (24 * 60)
+        for commuter in self._commuters_by_departure.get(divmod(minute_of_day, 60), ()):
+            commuter.prefetch_next_route()
+
+    def sync_commuter_positions(self) -> None:
+        """
+        Place commuters in transport along their paths, if the model does not track their positions on every tick.
+        """
+        if not self.track_positions:
+            for commuter in self.schedule.agents:
+                commuter.sync_position()
+
+    def _collect(self) -> None:
         self.datacollector.collect(self)
+        latest_values = {
+            name: values[-1] for name, values in self.datacollector.model_vars.items()
+        }
+        for rollup in self.rollups.values():
+            rollup.update(latest_values["time"], latest_values)
 
     def __update_clock(self) -> None:
         self.minute += 5
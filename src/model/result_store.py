@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Optional
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fingerprint_files(paths: Iterable[Optional[str]]) -> str:
+    """
+    Hash of the contents of data files, leaving out None paths. A shapefile is hashed together with its sidecar files
+    (.dbf, .shx, ...).
+    """
+    digest = hashlib.sha256()
+    for path in sorted(path for path in paths if path is not None):
+        stem, _ = os.path.splitext(path)
+        for file in sorted(glob.glob(glob.escape(stem) + ".*")) or [path]:
+            digest.update(os.path.basename(file).encode())
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_code_version() -> str:
+    """
+    Hash of the model source code, which, unlike a commit id, also changes with uncommitted edits.
+    """
+    digest = hashlib.sha256()
+    for file in sorted(
+        glob.glob(os.path.join(SOURCE_DIR, "**", "*.py"), recursive=True)
+    ):
+        digest.update(os.path.relpath(file, SOURCE_DIR).encode())
+        with open(file, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def get_run_key(
+    model_params: Dict[str, Any],
+    seed: Optional[int],
+    data_fingerprint: str,
+    code_version: str,
+) -> str:
+    """
+    Key that identifies a model run: the hash of its constructor arguments, seed, input data and code version.
+    """
+    run = {
+        "model_params": model_params,
+        "seed": seed,
+        "data_fingerprint": data_fingerprint,
+        "code_version": code_version,
+    }
+    return hashlib.sha256(
+        json.dumps(run, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class ResultStore(ABC):
+    """
+    Results of completed model runs, by run key.
+    """
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        pass
+
+
+class DirectoryResultStore(ResultStore):
+    """
+    One pickle file per run in a local directory.
+    """
+
+    directory: str
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._get_path(key))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._get_path(key), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        # write to a temporary file first, so that a crash never leaves a partial result behind
+        tmp_path = f"{self._get_path(key)}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f)
+        os.replace(tmp_path, self._get_path(key))
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pkl")
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    One row per run in an SQLite database.
+    """
+
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result BLOB NOT NULL)"
+            )
+
+    def __contains__(self, key: str) -> bool:
+        with sqlite3.connect(self.path) as connection:
+            return (
+                connection.execute(
+                    "SELECT 1 FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                is not None
+            )
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with sqlite3.connect(self.path) as connection:
+            row = connection.execute(
+                "SELECT result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, result) VALUES (?, ?)",
+                (key, pickle.dumps(result)),
+            )
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Dict, List, Sequence
+
+import pandas as pd
+
+ROLLUP_BUCKETS = {"hour": pd.Timedelta(hours=1), "day": pd.Timedelta(days=1)}
+ROLLUP_STATS = ("min", "mean", "max")
+
+
+class TimeRollup:
+    """
+    Streaming min/mean/max of model-level series per time bucket, e.g., per hour or per day.
+
+    The bucket that is currently being filled is included, so that the rollup is always up to date with the raw
+    series it summarizes.
+    """
+
+    bucket: pd.Timedelta
+    series: List[str]
+    times: List[pd.Timedelta]  # start time of each bucket
+    _stats: Dict[str, Dict[str, List[float]]]
+    _count: int  # number of values in the current bucket
+    _sum: Dict[str, float]  # sum of values in the current bucket
+
+    def __init__(self, series: Sequence[str], bucket: pd.Timedelta) -> None:
+        self.bucket = bucket
+        self.series = list(series)
+        self.times = []
+        self._stats = {
+            name: {stat: [] for stat in ROLLUP_STATS} for name in self.series
+        }
+        self._count = 0
+        self._sum = dict()
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def update(self, time: pd.Timedelta, values: Dict[str, float]) -> None:
+        bucket_start = (time // self.bucket) * self.bucket
+        if not self.times or bucket_start != self.times[-1]:
+            self.times.append(bucket_start)
+            self._count = 1
+            for name in self.series:
+                value = values[name]
+                self._sum[name] = value
+                for stat in ROLLUP_STATS:
+                    self._stats[name][stat].append(value)
+        else:
+            self._count += 1
+            for name in self.series:
+                value = values[name]
+                stats = self._stats[name]
+                self._sum[name] += value
+                stats["min"][-1] = min(stats["min"][-1], value)
+                stats["max"][-1] = max(stats["max"][-1], value)
+                stats["mean"][-1] = self._sum[name] / self._count
+
+    def get_series(self, name: str, stat: str = "mean") -> List[float]:
+        return self._stats[name][stat]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        One row per bucket, with the mean of each series under its own name and its min and max under
+        "<name>_min" and "<name>_max". Its attrs["rollup_bucket"] is the bucket size.
+        """
+        columns = {"time": self.times}
+        for name in self.series:
+            columns[name] = self._stats[name]["mean"]
+            columns[f"{name}_min"] = self._stats[name]["min"]
+            columns[f"{name}_max"] = self._stats[name]["max"]
+        rollup_df = pd.DataFrame(columns)
+        rollup_df.attrs["rollup_bucket"] = self.bucket
+        return rollup_df
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import itertools
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+import mesa
+import pandas as pd
+
+from src.model.result_store import (
+    ResultStore,
+    fingerprint_files,
+    get_code_version,
+    get_run_key,
+)
+from src.model.stopping import is_confidence_interval_tight
+
+
+class BackgroundRunner:
+    """
+    Steps a model continuously in a daemon thread, independent of any viewer.
+
+    The model is stepped at ``ticks_per_second`` or, if that is ``None`` or 0,
+    as fast as possible. Every step is taken while holding ``lock``, so readers
+    that acquire the same lock always observe the state after a completed step.
+    """
+
+    model: mesa.Model
+    ticks_per_second: Optional[float]
+    lock: threading.Lock
+    steps: int
+    _thread: Optional[threading.Thread]
+    _stop_event: threading.Event
+
+    def __init__(
+        self, model: mesa.Model, ticks_per_second: Optional[float] = None
+    ) -> None:
+        self.model = model
+        self.ticks_per_second = ticks_per_second
+        self.lock = threading.Lock()
+        self.steps = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.is_alive:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop_event.set()
+        if self.is_alive:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        interval = 1.0 / self.ticks_per_second if self.ticks_per_second else 0.0
+        next_tick = time.perf_counter()
+        while not self._stop_event.is_set():
+            with self.lock:
+                if not self.model.running:
+                    break
+                self.model.step()
+                self.steps += 1
+            if interval:
+                next_tick += interval
+                if (delay := next_tick - time.perf_counter()) > 0:
+                    self._stop_event.wait(delay)
+                else:
+                    # running behind schedule: do not try to catch up with a burst of steps
+                    next_tick = time.perf_counter()
+            else:
+                # release the GIL so that readers waiting on the lock get a turn
+                time.sleep(0)
+
+
+def run_replicates(
+    model_cls: Type[mesa.Model],
+    model_params: Dict[str, Any],
+    max_steps: int,
+    max_replicates: int,
+    min_replicates: int = 3,
+    ci_series: Optional[List[str]] = None,
+    ci_tolerance: Optional[float] = None,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Run replicates of a model, each until it stops running or reaches max_steps.
+
+    If seed is given, replicate i is seeded with seed + i, so that the replicates differ but the batch is
+    reproducible; otherwise, each replicate is seeded at random.
+
+    If ci_tolerance is given, no more replicates are run once the confidence intervals of the final values of all
+    ci_series are tight enough; by default, those are the status_* and friendship_* series, as in the model's own
+    convergence check. Each row of the result holds the final values of the model reporters of one replicate, with
+    the reason why it stopped; the reason why no more replicates were run is in its attrs["stopping_reason"].
+    """
+    if "seed" in model_params:
+        # identical replicates would make every confidence interval tight
+        raise ValueError(
+            "Pass the seed of the replicates as seed, not in model_params."
+        )
+    results = []
+    batch_stopping_reason = "max_replicates"
+    for replicate in range(max_replicates):
+        replicate_seed = None if seed is None else seed + replicate
+        model = model_cls(**model_params, seed=replicate_seed)
+        results.append(
+            {
+                "replicate": replicate,
+                "seed": replicate_seed,
+                **_run_model(model, max_steps),
+            }
+        )
+        if ci_series is None:
+            ci_series = [
+                name
+                for name in results[0]
+                if name.startswith(("status_", "friendship_"))
+            ]
+        if (
+            ci_tolerance is not None
+            and len(results) >= min_replicates
+            and all(
+                is_confidence_interval_tight(
+                    [result[name] for result in results], ci_tolerance
+                )
+                for name in ci_series
+            )
+        ):
+            batch_stopping_reason = "confidence_interval"
+            break
+    results_df = pd.DataFrame(results)
+    results_df.attrs["stopping_reason"] = batch_stopping_reason
+    return results_df
+
+
+def run_sweep(
+    model_cls: Type[mesa.Model],
+    parameter_grid: Dict[str, List[Any]],
+    seeds: Iterable[int],
+    max_steps: int,
+    store: ResultStore,
+    fixed_params: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Run a model once for every combination of parameter_grid values and seed, until it stops running or reaches
+    max_steps, skipping the runs that are already in store.
+
+    Runs are keyed by their parameters, seed, the contents of the data files they read and the model source code, and
+    each is stored as soon as it completes, so an interrupted or extended sweep resumes where it stopped. Each row of
+    the result holds the parameters and seed of one run, whether it was reused from store, and the final values of
+    the model reporters; the full model_vars of a run can be read back from store with its "key".
+    """
+    fixed_params = fixed_params or dict()
+    # iterated once per parameter combination, so a generator must not be used up by the first one
+    seeds = list(seeds)
+    code_version = get_code_version()
+    data_fingerprints = dict()
+    names = list(parameter_grid)
+    results = []
+    for values in itertools.product(*parameter_grid.values()):
+        model_params = {**fixed_params, **dict(zip(names, values))}
+        data_files = tuple(sorted(_get_data_files(model_cls, model_params)))
+        if data_files not in data_fingerprints:
+            data_fingerprints[data_files] = fingerprint_files(data_files)
+        for seed in seeds:
+            key = get_run_key(
+                model_params, seed, data_fingerprints[data_files], code_version
+            )
+            result = store.get(key)
+            cached = result is not None
+            if not cached:
+                model = model_cls(**model_params, seed=seed)
+                result = {
+                    "summary": _run_model(model, max_steps),
+                    "model_vars": model.datacollector.get_model_vars_dataframe(),
+                }
+                store.put(key, result)
+            results.append(
+                {
+                    "key": key,
+                    "seed": seed,
+                    "cached": cached,
+                    **dict(zip(names, values)),
+                    **result["summary"],
+                }
+            )
+    return pd.DataFrame(results)
+
+
+def _get_data_files(
+    model_cls: Type[mesa.Model], model_params: Dict[str, Any]
+) -> List[str]:
+    """
+    The data files that a run reads, if the model class tells, or else all given "*_file" parameters.
+    """
+    if hasattr(model_cls, "get_data_files"):
+        data_files = model_cls.get_data_files(model_params)
+    else:
+        data_files = [v for k, v in model_params.items() if k.endswith("_file")]
+    return [data_file for data_file in data_files if data_file is not None]
+
+
+def _run_model(model: mesa.Model, max_steps: int) -> Dict[str, Any]:
+    """
+    Step a model until it stops running or reaches max_steps, and summarize the run.
+    """
+    while model.running and model.schedule.steps < max_steps:
+        model.step()
+    if model.running:
+        stopping_reason = "max_steps"
+    else:
+        stopping_reason = getattr(model, "stopping_reason", None) or "stopped"
+    # e.g., to stop the worker processes of a model that did not stop running by itself
+    if hasattr(model, "close"):
+        model.close()
+    return {
+        "steps": model.schedule.steps,
+        "stopping_reason": stopping_reason,
+        **{name: values[-1] for name, values in model.datacollector.model_vars.items()},
+    }
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+import mesa
+import numpy as np
+
+TICKS_PER_DAY = 288  # 5 minutes per tick
+
+
+class DailyConvergence:
+    """
+    Stopping rule for a single run, checked once per simulated day.
+
+    A run has converged once the daily mean of every tracked datacollector series has changed by no more than
+    `tolerance`, relative to the day before, for `patience` days in a row.
+    """
+
+    series: List[str]
+    tolerance: float
+    patience: int
+    num_stable_days: int
+
+    def __init__(
+        self, series: Sequence[str], tolerance: float = 0.01, patience: int = 2
+    ) -> None:
+        self.series = list(series)
+        self.tolerance = tolerance
+        self.patience = patience
+        self.num_stable_days = 0
+
+    def update(self, datacollector: mesa.DataCollector) -> bool:
+        """
+        Compare the day that has just ended with the day before, and return whether the run has converged.
+        """
+        if len(datacollector.model_vars[self.series[0]]) < 2 * TICKS_PER_DAY:
+            return False
+        is_stable = True
+        for name in self.series:
+            values = np.asarray(
+                datacollector.model_vars[name][-2 * TICKS_PER_DAY :], dtype=float
+            )
+            previous_mean = values[:TICKS_PER_DAY].mean()
+            current_mean = values[TICKS_PER_DAY:].mean()
+            if abs(current_mean - previous_mean) > self.tolerance * max(
+                abs(previous_mean), 1.0
+            ):
+                is_stable = False
+                break
+        self.num_stable_days = self.num_stable_days + 1 if is_stable else 0
+        return self.num_stable_days >= self.patience
+
+
+def is_confidence_interval_tight(
+    values: Sequence[float], tolerance: float, confidence: float = 0.95
+) -> bool:
+    """
+    Whether the confidence interval of the mean of replicate values has a half-width within `tolerance` of the mean.
+    """
+    from scipy import stats
+
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return False
+    half_width = stats.t.ppf((1 + confidence) / 2, df=len(values) - 1) * stats.sem(
+        values
+    )
+    return half_width <= tolerance * max(abs(values.mean()), 1.0)
@@ -14,9 +14,11 @@ class Campus(mg.GeoSpace):
     homes: Tuple[Building]
     works: Tuple[Building]
     other_buildings: Tuple[Building]
-    home_counter: DefaultDict[mesa.space.FloatCoordinate, int]
+    home_counter: DefaultDict[int, int]  # number of commuters in each home, by id
     _buildings: Dict[int, Building]
-    _commuters_pos_map: DefaultDict[mesa.space.FloatCoordinate, Set[Commuter]]
+    # commuters inside each building, by building id, and the building id of each commuter inside one
+    _commuters_by_building: DefaultDict[int, Set[Commuter]]
+    _building_of_commuter: Dict[int, int]
     _commuter_id_map: Dict[int, Commuter]
 
     def __init__(self, crs: str) -> None:
@@ -26,7 +28,8 @@ class Campus(mg.GeoSpace):
         self.other_buildings = tuple()
         self.home_counter = defaultdict(int)
         self._buildings = dict()
-        self._commuters_pos_map = defaultdict(set)
+        self._commuters_by_building = defaultdict(set)
+        self._building_of_commuter = dict()
         self._commuter_id_map = dict()
 
     def get_random_home(self) -> Building:
@@ -54,38 +57,56 @@ class Campus(mg.GeoSpace):
         self.works = self.works + tuple(works)
         self.homes = self.homes + tuple(homes)
 
-    def get_commuters_by_pos(
-        self, float_pos: mesa.space.FloatCoordinate
-    ) -> Set[Commuter]:
-        return self._commuters_pos_map[float_pos]
+    def get_commuters_by_building(self, building_id: int) -> Set[Commuter]:
+        return self._commuters_by_building[building_id]
+
+    def get_commuters_in_building_of(self, commuter: Commuter) -> Set[Commuter]:
+        """
+        Commuters inside the same building as the given one, itself included, or none if it is on the road.
+        """
+        if (building_id := self._building_of_commuter.get(commuter.unique_id)) is None:
+            return set()
+        return self._commuters_by_building[building_id]
 
     def get_commuter_by_id(self, commuter_id: int) -> Commuter:
         return self._commuter_id_map[commuter_id]
 
-    def add_commuter(self, agent: Commuter) -> None:
+    def add_commuter(
+        self, agent: Commuter, building: Optional[Building] = None
+    ) -> None:
+        """
+        Add a commuter, inside the given building if any, or else on the road.
+        """
         super().add_agents([agent])
-        self._commuters_pos_map[(agent.geometry.x, agent.geometry.y)].add(agent)
+        if building is not None:
+            self._commuters_by_building[building.unique_id].add(agent)
+            self._building_of_commuter[agent.unique_id] = building.unique_id
         self._commuter_id_map[agent.unique_id] = agent
 
-    def update_home_counter(
-        self,
-        old_home_pos: Optional[mesa.space.FloatCoordinate],
-        new_home_pos: mesa.space.FloatCoordinate,
-    ) -> None:
-        if old_home_pos is not None:
-            self.home_counter[old_home_pos] -= 1
-        self.home_counter[new_home_pos] += 1
+    def update_home_counter(self, old_home_id: Optional[int], new_home_id: int) -> None:
+        if old_home_id is not None:
+            self.home_counter[old_home_id] -= 1
+        self.home_counter[new_home_id] += 1
 
     def move_commuter(
         self, commuter: Commuter, pos: mesa.space.FloatCoordinate
     ) -> None:
+        """
+        Move a commuter to a position on the road.
+        """
         self.__remove_commuter(commuter)
         commuter.geometry = Point(pos)
         self.add_commuter(commuter)
 
+    def move_commuter_to_building(self, commuter: Commuter, building: Building) -> None:
+        self.__remove_commuter(commuter)
+        commuter.geometry = Point(building.centroid)
+        self.add_commuter(commuter, building=building)
+
     def __remove_commuter(self, commuter: Commuter) -> None:
         super().remove_agent(commuter)
         del self._commuter_id_map[commuter.unique_id]
-        self._commuters_pos_map[(commuter.geometry.x, commuter.geometry.y)].remove(
-            commuter
-        )
+        if (
+            building_id := self._building_of_commuter.pop(commuter.unique_id, None)
+        ) is not None:
+            self._commuters_by_building[building_id].remove(commuter)
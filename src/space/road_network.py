@@ -1,37 +1,116 @@
 from __future__ import annotations
 
+import hashlib
+import math
 import pickle
-from typing import Dict, List, Tuple, Optional
+import sys
+from collections import OrderedDict, defaultdict
+from typing import (
+    TYPE_CHECKING,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Set,
+    Tuple,
+    Optional,
+)
 
+import numpy as np
 import geopandas as gpd
-import momepy
 import pyproj
+import shapely
 import networkx as nx
 import mesa
-from sklearn.neighbors import KDTree
 
-from src.space.utils import segmented
+from src.space.utils import get_segments
+
+if TYPE_CHECKING:
+    from sklearn.neighbors import KDTree
+
+_EMPTY_PATH_SIZE = sys.getsizeof(np.empty(0, dtype=np.int32))
+
+
+def _get_segment_key(u: int, v: int) -> Tuple[int, int]:
+    # road segments and paths are undirected, so both directions share one key
+    return (u, v) if u <= v else (v, u)
 
 
 class RoadNetwork:
-    _nx_graph: nx.Graph
+    """
+    Routing graph of a road network. Road vertices are identified by dense integer ids, which index the rows of
+    node_coords, and paths are int32 arrays of vertex ids.
+    """
+
+    _nx_graph: nx.MultiGraph  # nodes are road vertex ids
     _kd_tree: KDTree
     _crs: pyproj.CRS
+    node_coords: (
+        np.ndarray
+    )  # coordinates of the road vertex with id i in row i: (num_vertices, 2)
+    # interior vertex of a contracted chain -> (u, v, key) of its edge and the vertex index in the edge's nodes
+    _chain_of: Dict[int, Tuple[int, int, int, int]]
+    # road segments whose length was changed by update_edges, with None for closed ones
+    _segment_lengths: Dict[Tuple[int, int], Optional[float]]
+    version: int  # incremented when the routing graph changes, so that copies can tell that they are outdated
 
-    def __init__(self, lines: gpd.GeoSeries):
-        segmented_lines = gpd.GeoDataFrame(geometry=segmented(lines))
-        G = momepy.gdf_to_nx(segmented_lines, approach="primal", length="length")
-        self.nx_graph = G.subgraph(max(nx.connected_components(G), key=len))
+    def __init__(self, lines: gpd.GeoSeries, simplify: bool = True):
+        # the same primal graph as momepy.gdf_to_nx(segmented(lines), approach="primal", length="length"),
+        # built directly from the segment coordinate arrays
+        start, end = get_segments(lines)
+        lengths = np.hypot(*(end - start).T)
+        coords, vertex_ids = np.unique(
+            np.concatenate([start, end]), axis=0, return_inverse=True
+        )
+        u, v = np.split(vertex_ids.reshape(-1), 2)
+        # number the vertices in order of first appearance, like the nodes of a graph built segment by segment
+        _, first_index = np.unique(np.column_stack([u, v]).ravel(), return_index=True)
+        order = np.argsort(first_index)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        u, v, coords = rank[u], rank[v], coords[order]
+        # imported here so that importing the model does not import scikit-learn (or scipy, which comes with it)
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        from sklearn.neighbors import KDTree
+
+        # keep the largest component only, the first one in vertex order if there are several
+        _, labels = connected_components(
+            coo_matrix((np.ones(len(u)), (u, v)), shape=(len(coords), len(coords))),
+            directed=False,
+        )
+        sizes = np.bincount(labels)
+        largest = labels[np.flatnonzero(sizes[labels] == sizes.max())[0]]
+        in_largest = labels == largest
+        new_ids = np.cumsum(in_largest) - 1
+        segment_mask = in_largest[u]
+        self.node_coords = coords[in_largest]
+        G = nx.MultiGraph()
+        G.add_edges_from(
+            (u, v, {"length": length})
+            for u, v, length in zip(
+                new_ids[u[segment_mask]].tolist(),
+                new_ids[v[segment_mask]].tolist(),
+                lengths[segment_mask].tolist(),
+            )
+        )
+        # nearest node searches are done over all road vertices, including those contracted away below, and
+        # return vertex ids since the tree is built over node_coords
+        self._kd_tree = KDTree(self.node_coords)
+        self._chain_of = dict()
+        self._segment_lengths = dict()
+        self.version = 0
+        self.nx_graph = self._contract_degree2_chains(G) if simplify else G
         self.crs = lines.crs
 
     @property
-    def nx_graph(self) -> nx.Graph:
+    def nx_graph(self) -> nx.MultiGraph:
         return self._nx_graph
 
     @nx_graph.setter
     def nx_graph(self, nx_graph) -> None:
         self._nx_graph = nx_graph
-        self._kd_tree = KDTree(nx_graph.nodes)
 
     @property
     def crs(self) -> pyproj.CRS:
@@ -41,52 +120,620 @@ class RoadNetwork:
     def crs(self, crs) -> None:
         self._crs = crs
 
-    def get_nearest_node(
-        self, float_pos: mesa.space.FloatCoordinate
-    ) -> mesa.space.FloatCoordinate:
+    def get_nearest_node(self, float_pos: mesa.space.FloatCoordinate) -> int:
         node_index = self._kd_tree.query([float_pos], k=1, return_distance=False)
-        node_pos = self._kd_tree.get_arrays()[0][node_index[0, 0]]
-        return tuple(node_pos)
+        return int(node_index[0, 0])
+
+    def get_nearest_nodes(
+        self, float_positions: Iterable[mesa.space.FloatCoordinate]
+    ) -> List[int]:
+        node_indices = self._kd_tree.query(
+            list(float_positions), k=1, return_distance=False
+        )
+        return node_indices[:, 0].tolist()
+
+    def get_shortest_path(self, source: int, target: int) -> np.ndarray:
+        """
+        Shortest path between two road vertices, as an int32 array of vertex ids. Their coordinates are
+        node_coords[path].
+        """
+        if source in self.nx_graph and target in self.nx_graph:
+            # return nx.shortest_path(self.nx_graph, source, target, method="dijkstra", weight="length")
+            return self._expand_path(
+                nx.astar_path(self.nx_graph, source, target, weight="length")
+            )
+        return self._get_shortest_path_via_chains(source, target)
+
+    def pin_nodes(self, nodes: Iterable[int]) -> None:
+        """
+        Make sure that the given road vertices are nodes of the routing graph.
+
+        Routes between two graph nodes take a single shortest path search, whereas routes from or to a vertex that
+        was contracted into a chain need one search for each end of its chain.
+        """
+        for node in nodes:
+            if node in self._chain_of:
+                self._split_chain(node)
+                self.version += 1
+
+    def get_path_length(self, path: np.ndarray) -> float:
+        """
+        Length of a path of adjacent road vertices, with the lengths set by update_edges, if any.
+        """
+        if len(path) < 2:
+            return 0.0
+        lengths = np.hypot(*np.diff(self.node_coords[path], axis=0).T)
+        if self._segment_lengths:
+            for i, segment in enumerate(zip(path[:-1].tolist(), path[1:].tolist())):
+                segment_key = _get_segment_key(*segment)
+                if segment_key in self._segment_lengths:
+                    length = self._segment_lengths[segment_key]
+                    lengths[i] = math.inf if length is None else length
+        return float(lengths.sum())
+
+    def get_segment_length(self, u: int, v: int) -> Optional[float]:
+        """
+        Length of the road segment between two adjacent road vertices, or None if there is no such (open) segment.
+        """
+        segment_key = _get_segment_key(u, v)
+        if segment_key in self._segment_lengths:
+            return self._segment_lengths[segment_key]
+        if not self._has_segment(u, v):
+            return None
+        return float(np.hypot(*(self.node_coords[u] - self.node_coords[v])))
+
+    def get_segments_within(self, geometry: shapely.Geometry) -> List[Tuple[int, int]]:
+        """
+        Open road segments that intersect a geometry, e.g., the area of a construction site, as (u, v) vertex id
+        pairs.
+        """
+        segments = [
+            np.column_stack([nodes[:-1], nodes[1:]])
+            for *_, nodes in self.nx_graph.edges(data="nodes")
+            if nodes is not None
+        ] + [
+            np.array([[u, v]])
+            for u, v, nodes in self.nx_graph.edges(data="nodes")
+            if nodes is None
+        ]
+        if not segments:
+            return []
+        segments = np.concatenate(segments)
+        lines = shapely.linestrings(self.node_coords[segments])
+        return list(map(tuple, segments[shapely.intersects(lines, geometry)].tolist()))
+
+    def add_nodes(self, positions: Iterable[mesa.space.FloatCoordinate]) -> List[int]:
+        """
+        Add road vertices, e.g., the ends of a new shortcut, and return their ids, to connect them with update_edges.
+        """
+        first_id = len(self.node_coords)
+        self.node_coords = np.concatenate(
+            [self.node_coords, np.asarray(list(positions), dtype=float).reshape(-1, 2)]
+        )
+        return list(range(first_id, len(self.node_coords)))
+
+    def update_edges(self, lengths: Dict[Tuple[int, int], Optional[float]]) -> None:
+        """
+        Change the lengths of road segments, given by the ids of their two adjacent end vertices, or close them if
+        the length is None, while the model is running.
+
+        Giving a length to a closed segment reopens it, and to a segment between two vertices that are not adjacent
+        adds a new one. The nearest node search index is only rebuilt if that connects vertices from add_nodes. The
+        end vertices of updated segments become nodes of the routing graph. Closures may disconnect the walkway,
+        after which get_shortest_path raises nx.NetworkXNoPath between the parts, and commuters who cannot reach their
+        destination stay where they are.
+        """
+        self.version += 1
+        new_nodes = []
+        for (u, v), length in lengths.items():
+            for node in (u, v):
+                if not 0 <= node < len(self.node_coords):
+                    raise ValueError(f"Unknown road vertex id: {node}.")
+                if node in self._chain_of:
+                    self._split_chain(node)
+                elif node not in self.nx_graph:
+                    self.nx_graph.add_node(node)
+                    new_nodes.append(node)
+            self._segment_lengths[_get_segment_key(u, v)] = length
+            # with both ends as nodes, the segment is an edge of its own (or several, for duplicated segments)
+            keys = [
+                key
+                for key, data in self.nx_graph.get_edge_data(u, v, default={}).items()
+                if len(data.get("nodes", (u, v))) == 2
+            ]
+            if length is None:
+                self.nx_graph.remove_edges_from((u, v, key) for key in keys)
+            elif keys:
+                for key in keys:
+                    self.nx_graph.edges[u, v, key]["length"] = length
+            else:
+                self._add_chain(self.nx_graph, [u, v])
+        if new_nodes:
+            from sklearn.neighbors import KDTree
+
+            self._kd_tree = KDTree(self.node_coords)
+
+    def _has_segment(self, u: int, v: int) -> bool:
+        for a, b in ((u, v), (v, u)):
+            if a in self._chain_of:
+                # a vertex inside a chain is only adjacent to its two neighbors in the chain
+                chain_u, chain_v, key, index = self._chain_of[a]
+                nodes = self.nx_graph.edges[chain_u, chain_v, key]["nodes"]
+                return b in (nodes[index - 1], nodes[index + 1])
+        return any(
+            len(data.get("nodes", (u, v))) == 2
+            for data in self.nx_graph.get_edge_data(u, v, default={}).values()
+        )
+
+    def _contract_degree2_chains(self, G: nx.MultiGraph) -> nx.MultiGraph:
+        """
+        Collapse every chain of degree-2 vertices into a single edge between its two end nodes.
+
+        Each contracted edge keeps the full vertex sequence of its chain in its "nodes" attribute, ordered from the
+        edge's first end node in self._chain_of, so that paths can be expanded back vertex by vertex.
+        """
+
+        degree = dict(G.degree())
+        self_loops = set(nx.nodes_with_selfloops(G))
+
+        def is_anchor(node) -> bool:
+            return degree[node] != 2 or node in self_loops
+
+        H = nx.MultiGraph()
+        H.add_nodes_from(node for node in G.nodes if is_anchor(node))
+        visited = set()
+
+        def get_edge_key(u, v, k) -> Tuple[int, int, int]:
+            # undirected, as the edge is walked from either end, without mixing the parallel edge key with vertex ids
+            return min(u, v), max(u, v), k
+
+        def walk(start, first_edge) -> None:
+            nodes = [start]
+            prev_edge, node = first_edge, first_edge[1]
+            visited.add(get_edge_key(*prev_edge))
+            while not is_anchor(node):
+                nodes.append(node)
+                prev_edge = next(
+                    (u, v, k)
+                    for u, v, k in G.edges(node, keys=True)
+                    if get_edge_key(u, v, k) not in visited
+                )
+                visited.add(get_edge_key(*prev_edge))
+                node = prev_edge[1]
+                if node == start:
+                    break
+            nodes.append(node)
+            self._add_chain(H, nodes)
+
+        for anchor in list(H.nodes):
+            for edge in G.edges(anchor, keys=True):
+                if get_edge_key(*edge) not in visited:
+                    walk(anchor, edge)
+        # isolated cycles without any anchor: promote one of their vertices to a node
+        for u, v, k in G.edges(keys=True):
+            if get_edge_key(u, v, k) not in visited:
+                H.add_node(u)
+                walk(u, (u, v, k))
+        return H
+
+    def _add_chain(self, H: nx.MultiGraph, nodes: Iterable[int]) -> None:
+        nodes = np.asarray(nodes, dtype=np.int32)
+        u, v = int(nodes[0]), int(nodes[-1])
+        key = H.add_edge(u, v, length=self.get_path_length(nodes), nodes=nodes)
+        for index, node in enumerate(nodes[1:-1].tolist(), start=1):
+            self._chain_of[node] = (u, v, key, index)
+
+    def _split_chain(self, node: int) -> None:
+        u, v, key, index = self._chain_of.pop(node)
+        nodes = self.nx_graph.edges[u, v, key]["nodes"]
+        self.nx_graph.remove_edge(u, v, key)
+        self._add_chain(self.nx_graph, nodes[: index + 1])
+        self._add_chain(self.nx_graph, nodes[index:])
+
+    def _get_chain_key(self, u: int, v: int) -> int:
+        # of several parallel chains, a shortest path always takes the shortest one
+        return min(self.nx_graph[u][v], key=lambda k: self.nx_graph[u][v][k]["length"])
+
+    def _get_chain_nodes(self, u: int, v: int, key: Optional[int] = None) -> np.ndarray:
+        if key is None:
+            key = self._get_chain_key(u, v)
+        # edges of an unsimplified graph are single segments without stored nodes
+        nodes = self.nx_graph.edges[u, v, key].get("nodes")
+        if nodes is None:
+            return np.array([u, v], dtype=np.int32)
+        return nodes if nodes[0] == u else nodes[::-1]
+
+    def _expand_path(self, nodes: List[int]) -> np.ndarray:
+        return np.concatenate(
+            [np.array(nodes[:1], dtype=np.int32)]
+            + [self._get_chain_nodes(u, v)[1:] for u, v in zip(nodes[:-1], nodes[1:])]
+        )
+
+    def _get_exits(self, node: int) -> List[Tuple[int, float, np.ndarray]]:
+        """
+        Graph nodes through which a route from the given road vertex can leave, with the length and vertices of
+        the way there.
+        """
+        if node in self.nx_graph:
+            return [(node, 0.0, np.array([node], dtype=np.int32))]
+        u, v, key, index = self._chain_of[node]
+        nodes = self._get_chain_nodes(u, v, key)
+        exits = []
+        for exit_nodes in (nodes[index::-1], nodes[index:]):
+            exits.append(
+                (int(exit_nodes[-1]), self.get_path_length(exit_nodes), exit_nodes)
+            )
+        return exits
+
+    def _get_shortest_path_via_chains(self, source: int, target: int) -> np.ndarray:
+        best_length, best_path = float("inf"), None
+        from_chain = self._chain_of.get(source)
+        if (
+            from_chain is not None
+            and from_chain[:3] == self._chain_of.get(target, ())[:3]
+        ):
+            # both vertices are on the same chain: walking along it is a candidate too
+            u, v, key, _ = from_chain
+            nodes = self._get_chain_nodes(u, v, key)
+            i, j = from_chain[3], self._chain_of[target][3]
+            best_path = nodes[i : j + 1] if i <= j else nodes[j : i + 1][::-1]
+            best_length = self.get_path_length(best_path)
+        for from_exit, from_length, from_nodes in self._get_exits(source):
+            for to_exit, to_length, to_nodes in self._get_exits(target):
+                try:
+                    length, nodes = nx.bidirectional_dijkstra(
+                        self.nx_graph, from_exit, to_exit, weight="length"
+                    )
+                except nx.NetworkXNoPath:
+                    # closures may cut off one end of a chain but not the other
+                    continue
+                if (length := from_length + length + to_length) < best_length:
+                    best_length = length
+                    best_path = np.concatenate(
+                        [
+                            from_nodes[:-1],
+                            self._expand_path(nodes),
+                            to_nodes[::-1][1:],
+                        ]
+                    )
+        if best_path is None:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+        return best_path
+
 
-    def get_shortest_path(
-        self, source: mesa.space.FloatCoordinate, target: mesa.space.FloatCoordinate
-    ) -> List[mesa.space.FloatCoordinate]:
-        from_node_pos = self.get_nearest_node(source)
-        to_node_pos = self.get_nearest_node(target)
-        # return nx.shortest_path(self.nx_graph, from_node_pos, to_node_pos, method="dijkstra", weight="length")
-        return nx.astar_path(self.nx_graph, from_node_pos, to_node_pos, weight="length")
+class PathCache:
+    """
+    LRU cache of shortest paths, bounded by a number of entries and/or an estimated number of bytes.
+
+    Paths are undirected, so each one is stored once and read in reverse for the opposite direction. Each path is
+    also indexed by the road segments it goes through, so that the paths using a segment can be invalidated when the
+    segment changes.
+    """
+
+    max_entries: Optional[int]
+    max_bytes: Optional[int]
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size_bytes: int  # estimated memory held by the cached paths
+    # (path, its estimated size, its length) by the unordered pair of its end vertex ids
+    _paths: OrderedDict[Tuple[int, int], Tuple[np.ndarray, int, float]]
+    _keys_by_segment: DefaultDict[Tuple[int, int], Set[Tuple[int, int]]]
+
+    def __init__(
+        self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.size_bytes = 0
+        self._paths = OrderedDict()
+        self._keys_by_segment = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __contains__(self, source_target: Tuple[int, int]) -> bool:
+        # unlike get, neither counted as a lookup nor marked as used
+        return self._get_key(*source_target) in self._paths
+
+    @property
+    def hit_rate(self) -> float:
+        num_lookups = self.hits + self.misses
+        return self.hits / num_lookups if num_lookups else 0.0
+
+    def get(self, source: int, target: int) -> Optional[np.ndarray]:
+        key = self._get_key(source, target)
+        if (entry := self._paths.get(key)) is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._paths.move_to_end(key)
+        path = entry[0]
+        return path if key[0] == source else path[::-1]
+
+    def put(
+        self, source: int, target: int, path: np.ndarray, length: float = math.inf
+    ) -> None:
+        """
+        Cache a path with its length. An unknown (infinite) length makes the path count as improvable by any
+        shortened segment.
+        """
+        key = self._get_key(source, target)
+        if key[0] != source:
+            path = path[::-1]
+        self._remove(key)
+        size = self._get_path_size(path)
+        self._paths[key] = (path, size, length)
+        self.size_bytes += size
+        for segment in zip(path[:-1].tolist(), path[1:].tolist()):
+            self._keys_by_segment[_get_segment_key(*segment)].add(key)
+        while self._paths and (
+            (self.max_entries is not None and len(self._paths) > self.max_entries)
+            or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._paths)))
+            self.evictions += 1
+
+    def get_keys_through(self, u: int, v: int) -> Set[Tuple[int, int]]:
+        """
+        Keys of the cached paths that go through the road segment between two adjacent vertices.
+        """
+        return set(self._keys_by_segment.get(_get_segment_key(u, v), ()))
+
+    def invalidate(self, keys: Iterable[Tuple[int, int]]) -> None:
+        for key in keys:
+            if self._remove(key):
+                self.invalidations += 1
+
+    def lengths(self) -> Iterator[Tuple[Tuple[int, int], float]]:
+        for key, (_, _, length) in self._paths.items():
+            yield key, length
+
+    def items(self) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+        """
+        Cached paths from least to most recently used.
+        """
+        for key, (path, *_) in self._paths.items():
+            yield key, path
+
+    def _remove(self, key: Tuple[int, int]) -> bool:
+        if (entry := self._paths.pop(key, None)) is None:
+            return False
+        path, size, _ = entry
+        self.size_bytes -= size
+        for segment in zip(path[:-1].tolist(), path[1:].tolist()):
+            segment_key = _get_segment_key(*segment)
+            if keys := self._keys_by_segment.get(segment_key):
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_segment[segment_key]
+        return True
+
+    @staticmethod
+    def _get_key(source: int, target: int) -> Tuple[int, int]:
+        return _get_segment_key(source, target)
+
+    @staticmethod
+    def _get_path_size(path: np.ndarray) -> int:
+        # the array object and its int32 vertex ids
+        return _EMPTY_PATH_SIZE + path.nbytes
 
 
 class CampusWalkway(RoadNetwork):
     campus: str
-    _path_select_cache: Dict[
-        Tuple[mesa.space.FloatCoordinate, mesa.space.FloatCoordinate],
-        List[mesa.space.FloatCoordinate],
-    ]
+    _path_select_cache: PathCache
+    _node_coords_digest: (
+        str  # identifies the road vertices that the saved paths refer to
+    )
+    # number of trips through each edge/node of the routing graph, per time-of-day bin: (num_time_bins, num_edges)
+    edge_flows: Optional[np.ndarray]
+    node_flows: Optional[np.ndarray]
+    _flow_nodes: np.ndarray  # vertex ids of the counted nodes
+    _flow_node_index: np.ndarray  # index of each road vertex in _flow_nodes, or -1
+    _flow_edge_ids: Dict[Tuple[int, int], int]
+    _flow_edge_nodes: List[np.ndarray]
 
-    def __init__(self, campus, lines) -> None:
+    def __init__(
+        self,
+        campus,
+        lines,
+        max_cached_paths: Optional[int] = None,
+        max_path_cache_bytes: Optional[int] = None,
+    ) -> None:
         super().__init__(lines)
         self.campus = campus
+        self._path_select_cache = PathCache(
+            max_entries=max_cached_paths, max_bytes=max_path_cache_bytes
+        )
         self._path_cache_result = f"outputs/{campus}_path_cache_result.pkl"
+        self._node_coords_digest = hashlib.sha256(
+            self.node_coords.tobytes()
+        ).hexdigest()
         try:
             with open(self._path_cache_result, "rb") as cached_result:
-                self._path_select_cache = pickle.load(cached_result)
+                saved_paths = pickle.load(cached_result)
         except FileNotFoundError:
-            self._path_select_cache = dict()
+            saved_paths = dict()
+        # vertex ids are only meaningful for the road vertices they were saved with
+        if saved_paths.get("node_coords_digest") == self._node_coords_digest:
+            # most recently used paths come last and are therefore kept if the cache is smaller now
+            for (source, target), path in saved_paths["paths"].items():
+                self._path_select_cache.put(
+                    source, target, path, length=self.get_path_length(path)
+                )
+        self._path_select_cache.evictions = 0
+        self.edge_flows = None
+        self.node_flows = None
 
-    def cache_path(
-        self,
-        source: mesa.space.FloatCoordinate,
-        target: mesa.space.FloatCoordinate,
-        path: List[mesa.space.FloatCoordinate],
-    ) -> None:
+    @property
+    def path_cache(self) -> PathCache:
+        return self._path_select_cache
+
+    def cache_path(self, source: int, target: int, path: np.ndarray) -> None:
         # print(f"caching path... current number of cached paths: {len(self._path_select_cache)}")
-        self._path_select_cache[(source, target)] = path
-        self._path_select_cache[(target, source)] = list(reversed(path))
-        with open(self._path_cache_result, "wb") as cached_result:
-            pickle.dump(self._path_select_cache, cached_result)
-
-    def get_cached_path(
-        self, source: mesa.space.FloatCoordinate, target: mesa.space.FloatCoordinate
-    ) -> Optional[List[mesa.space.FloatCoordinate]]:
-        return self._path_select_cache.get((source, target), None)
+        self._path_select_cache.put(
+            source, target, path, length=self.get_path_length(path)
+        )
+        # the saved paths are reused by later runs, which start with the walkway as it is in the data
+        if not self._segment_lengths:
+            with open(self._path_cache_result, "wb") as cached_result:
+                pickle.dump(
+                    {
+                        "node_coords_digest": self._node_coords_digest,
+                        "paths": dict(self._path_select_cache.items()),
+                    },
+                    cached_result,
+                )
+
+    def get_cached_path(self, source: int, target: int) -> Optional[np.ndarray]:
+        return self._path_select_cache.get(source, target)
+
+    def update_edges(self, lengths: Dict[Tuple[int, int], Optional[float]]) -> None:
+        """
+        Update road segments like RoadNetwork.update_edges, and invalidate the cached paths that this may change.
+
+        Paths through a segment that is closed or made longer are invalidated. A segment that is opened or made
+        shorter may shorten any path, so each cached path is checked against one shortest path search from each end
+        of the segment, and only paths that it shortens are invalidated.
+        """
+        old_lengths = {
+            segment: self.get_segment_length(*segment) for segment in lengths
+        }
+        super().update_edges(lengths)
+        shortened = []
+        for (u, v), length in lengths.items():
+            old_length = old_lengths[(u, v)]
+            if length is None or (old_length is not None and length > old_length):
+                self._path_select_cache.invalidate(
+                    self._path_select_cache.get_keys_through(u, v)
+                )
+            elif old_length is None or length < old_length:
+                shortened.append((u, v, length))
+        # searched in the updated graph, so that several shortened segments are checked together
+        for u, v, length in shortened:
+            self._invalidate_paths_shortened_by(u, v, length)
+
+    def _invalidate_paths_shortened_by(self, u: int, v: int, length: float) -> None:
+        path_lengths = dict(self._path_select_cache.lengths())
+        # paths through the segment itself stay shortest, their cached lengths are merely too long now
+        through_segment = self._path_select_cache.get_keys_through(u, v)
+        cutoff = max(
+            (length for length in path_lengths.values() if length < math.inf),
+            default=0.0,
+        )
+        from_u = nx.single_source_dijkstra_path_length(
+            self.nx_graph, u, cutoff=cutoff, weight="length"
+        )
+        from_v = nx.single_source_dijkstra_path_length(
+            self.nx_graph, v, cutoff=cutoff, weight="length"
+        )
+        stale = []
+        for (source, target), path_length in path_lengths.items():
+            if (source, target) in through_segment:
+                continue
+            if source not in self.nx_graph or target not in self.nx_graph:
+                # distances are only known between graph nodes
+                stale.append((source, target))
+                continue
+            length_via_segment = length + min(
+                from_u.get(source, math.inf) + from_v.get(target, math.inf),
+                from_v.get(source, math.inf) + from_u.get(target, math.inf),
+            )
+            if length_via_segment < path_length * (1 - 1e-9):
+                stale.append((source, target))
+        self._path_select_cache.invalidate(stale)
+
+    def enable_flow_counts(self, num_time_bins: int = 1) -> None:
+        """
+        Start counting trips through the edges and nodes of the routing graph, in num_time_bins equal bins of the
+        day. Counting is indexed by the graph as it is now, so nodes should be pinned before, and segments that
+        update_edges adds later are not counted.
+        """
+        self._flow_nodes = np.fromiter(self.nx_graph.nodes, dtype=np.int64)
+        self._flow_node_index = np.full(len(self.node_coords), -1, dtype=np.int64)
+        self._flow_node_index[self._flow_nodes] = np.arange(len(self._flow_nodes))
+        flow_edges = list(self.nx_graph.edges(keys=True))
+        self._flow_edge_nodes = [
+            self._get_chain_nodes(u, v, key) for u, v, key in flow_edges
+        ]
+        self._flow_edge_ids = dict()
+        for i, (u, v, key) in enumerate(flow_edges):
+            # like path expansion, trips between two nodes take the shortest of their parallel edges
+            if self._get_chain_key(u, v) == key:
+                u_id, v_id = self._flow_node_index[[u, v]].tolist()
+                self._flow_edge_ids[(u_id, v_id)] = i
+                self._flow_edge_ids[(v_id, u_id)] = i
+        self.edge_flows = np.zeros(
+            (num_time_bins, len(self._flow_edge_nodes)), dtype=np.int64
+        )
+        self.node_flows = np.zeros(
+            (num_time_bins, len(self._flow_nodes)), dtype=np.int64
+        )
+
+    def record_trip(self, path: np.ndarray, minute_of_day: int = 0) -> None:
+        """
+        Count one trip along a path, as returned by get_shortest_path, that starts at the given minute of the day.
+        """
+        if self.edge_flows is None:
+            return
+        time_bin = minute_of_day * len(self.edge_flows) // (24 * 60)
+        # vertices added after counting started are not counted
+        node_ids = self._flow_node_index[path[path < len(self._flow_node_index)]]
+        node_ids = node_ids[node_ids >= 0]
+        edge_ids = [
+            self._flow_edge_ids[edge]
+            for edge in zip(node_ids[:-1].tolist(), node_ids[1:].tolist())
+            if edge in self._flow_edge_ids
+        ]
+        np.add.at(self.node_flows[time_bin], node_ids, 1)
+        np.add.at(self.edge_flows[time_bin], edge_ids, 1)
+
+    def get_flows(self) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        """
+        Edges and nodes of the routing graph with their geometry and trip counts: the total in "flow" and, if
+        counted in several time bins, the count of bin i in "flow_<i>".
+        """
+
+        def flow_columns(flows: np.ndarray) -> Dict[str, np.ndarray]:
+            columns = {"flow": flows.sum(axis=0)}
+            if len(flows) > 1:
+                columns.update(
+                    {f"flow_{i}": bin_flows for i, bin_flows in enumerate(flows)}
+                )
+            return columns
+
+        edge_nodes = self._flow_edge_nodes
+        edges = gpd.GeoDataFrame(
+            flow_columns(self.edge_flows),
+            geometry=shapely.linestrings(
+                self.node_coords[np.concatenate(edge_nodes)],
+                indices=np.repeat(
+                    np.arange(len(edge_nodes)), [len(n) for n in edge_nodes]
+                ),
+            ),
+            crs=self.crs,
+        )
+        nodes = gpd.GeoDataFrame(
+            flow_columns(self.node_flows),
+            geometry=shapely.points(self.node_coords[self._flow_nodes]),
+            crs=self.crs,
+        )
+        return edges, nodes
+
+    def export_flows(self, edges_file: str, nodes_file: Optional[str] = None) -> None:
+        """
+        Write edge (and node) flows to GeoParquet if the file name ends with .parquet, or to GeoJSON otherwise.
+        """
+        edges, nodes = self.get_flows()
+        for flows, file in ((edges, edges_file), (nodes, nodes_file)):
+            if file is None:
+                continue
+            if file.endswith(".parquet"):
+                flows.to_parquet(file)
+            else:
+                flows.to_file(file, driver="GeoJSON")
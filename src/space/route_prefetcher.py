@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from shapely.geometry import LineString
+
+from src.space.road_network import CampusWalkway, RoadNetwork
+from src.space.utils import UnitTransformer, get_path_positions
+
+# a prefetched route: its path of road vertex ids, its length in meters, and the positions to visit along it one
+# per step, if the model tracks them
+PrefetchedRoute = Tuple[np.ndarray, float, Optional[np.ndarray]]
+
+# the copy of the road network and the settings of a worker process
+_worker_road_network: Optional[RoadNetwork] = None
+_worker_unit_transformer: Optional[UnitTransformer] = None
+_worker_speed: Optional[float] = None
+
+
+def _init_worker(road_network: RoadNetwork, speed: Optional[float]) -> None:
+    global _worker_road_network, _worker_unit_transformer, _worker_speed
+    _worker_road_network = road_network
+    _worker_unit_transformer = UnitTransformer(degree_crs=road_network.crs)
+    _worker_speed = speed
+
+
+def _get_route(source: int, target: int) -> PrefetchedRoute:
+    # the same computations as Commuter._path_select, on the copy of the road network
+    path = _worker_road_network.get_shortest_path(source, target)
+    if len(path) == 1:
+        return path, 0.0, _worker_road_network.node_coords[path]
+    path_in_meters = _worker_unit_transformer.degree2meter(
+        LineString(_worker_road_network.node_coords[path])
+    )
+    positions = (
+        None
+        if _worker_speed is None
+        else get_path_positions(path_in_meters, _worker_speed, _worker_unit_transformer)
+    )
+    return path, path_in_meters.length, positions
+
+
+class RoutePrefetcher:
+    """
+    Computes the routes of upcoming trips on a pool of worker processes, so that ticks with many departures do not
+    wait for shortest path searches and path resampling, e.g., after relocations or path cache evictions.
+
+    Each worker has a copy of the road network. Results are only used while the road network has not changed since
+    the pool was started; otherwise, pending results are dropped and the pool is restarted with a new copy when the
+    next route is prefetched.
+
+    Workers are not forked from the model's process, which may be multithreaded, e.g., when a background server
+    steps the model in a thread of its own, but started from a fork server, or spawned where there is none, and
+    receive a pickled copy of the road network.
+    """
+
+    walkway: CampusWalkway
+    # meters per step, to compute the positions along the routes, or None not to compute them
+    speed: Optional[float]
+    max_workers: Optional[int]
+    # routes that are not asked for within this many steps are dropped
+    max_age_steps: int
+    submitted: int
+    used: int  # routes that were ready when asked for
+    late: int  # routes that were still being computed when asked for
+    _executor: Optional[ProcessPoolExecutor]
+    _version: int  # version of the road network copied to the workers
+    # future of each prefetched route and the step at which it was submitted, by its two ends in either order, like
+    # the keys of the path cache
+    _pending: Dict[Tuple[int, int], Tuple[Future, int]]
+
+    def __init__(
+        self,
+        walkway: CampusWalkway,
+        speed: Optional[float] = None,
+        max_workers: Optional[int] = None,
+        max_age_steps: int = 288,
+    ) -> None:
+        self.walkway = walkway
+        self.speed = speed
+        self.max_workers = max_workers
+        self.max_age_steps = max_age_steps
+        self.submitted = 0
+        self.used = 0
+        self.late = 0
+        self._executor = None
+        self._version = walkway.version
+        self._pending = dict()
+
+    def prefetch(self, source: int, target: int, step: int) -> None:
+        """
+        Start computing the route from source to target, unless it is already cached or being prefetched, in either
+        direction.
+        """
+        key = self._get_key(source, target)
+        if key in self._pending or key in self.walkway.path_cache:
+            return
+        if self._executor is None or self._version != self.walkway.version:
+            self._restart()
+        self._pending[key] = (
+            self._executor.submit(_get_route, source, target),
+            step,
+        )
+        self.submitted += 1
+
+    def get_route(self, source: int, target: int) -> Optional[PrefetchedRoute]:
+        """
+        The prefetched route from source to target if it is ready, without waiting for it otherwise.
+
+        A route that was prefetched in the other direction is reversed, without its positions, which depend on the
+        direction.
+        """
+        if (entry := self._pending.get(self._get_key(source, target))) is None:
+            return None
+        future, _ = entry
+        if not future.done():
+            self.late += 1
+            return None
+        if (
+            self._version != self.walkway.version
+            or future.cancelled()
+            or future.exception() is not None
+        ):
+            # e.g., nx.NetworkXNoPath, which the synchronous search raises again
+            return None
+        self.used += 1
+        # kept until it gets too old, for other commuters who take the same route
+        path, length, positions = future.result()
+        if path[0] != source:
+            return path[::-1], length, None
+        return path, length, positions
+
+    def step(self, step: int) -> None:
+        """
+        Drop prefetched routes that were submitted more than max_age_steps ago.
+        """
+        for key, (future, submitted_step) in list(self._pending.items()):
+            if step - submitted_step > self.max_age_steps:
+                future.cancel()
+                del self._pending[key]
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker processes and drop all prefetched routes. The pool is started again if more are prefetched.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+
+    @staticmethod
+    def _get_key(source: int, target: int) -> Tuple[int, int]:
+        # a route serves both directions
+        return (source, target) if source <= target else (target, source)
+
+    def _restart(self) -> None:
+        self.shutdown()
+        self._version = self.walkway.version
+        start_method = (
+            "forkserver"
+            if "forkserver" in multiprocessing.get_all_start_methods()
+            else "spawn"
+        )
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+            initargs=(self.walkway, self.speed),
+        )
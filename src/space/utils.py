@@ -1,9 +1,10 @@
-from typing import Tuple, List
+from typing import Tuple, List, Type
 
 import geopandas as gpd
 import numpy as np
 import pyproj
 import mesa
+import shapely
 from shapely.geometry import LineString, MultiLineString
 from shapely.ops import transform
 
@@ -43,17 +44,49 @@ def get_rounded_coordinate(
     return round(float_coordinate[0]), round(float_coordinate[1])
 
 
+def get_segments(lines: gpd.GeoSeries) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Start and end coordinates of all two-point segments of (Multi)LineStrings, as two (n, 2) arrays.
+
+    Zero-length segments, i.e., repeated vertices, are left out.
+    """
+    coords, line_index = shapely.get_coordinates(
+        shapely.get_parts(np.asarray(lines)), return_index=True
+    )
+    mask = (line_index[:-1] == line_index[1:]) & np.any(
+        coords[:-1] != coords[1:], axis=1
+    )
+    return coords[:-1][mask], coords[1:][mask]
+
+
 def segmented(lines: gpd.GeoSeries) -> gpd.GeoSeries:
-    def _segmented(linestring: LineString) -> List[LineString]:
-        return [
-            LineString((start_node, end_node))
-            for start_node, end_node in zip(
-                linestring.coords[:-1], linestring.coords[1:]
-            )
-            if start_node != end_node
-        ]
+    start, end = get_segments(lines)
+    return gpd.GeoSeries(shapely.linestrings(np.stack((start, end), axis=1)))
 
-    return gpd.GeoSeries([segment for line in lines for segment in _segmented(line)])
+
+def get_centroids(geometries: gpd.GeoSeries) -> List[mesa.space.FloatCoordinate]:
+    return list(map(tuple, shapely.get_coordinates(geometries.centroid).tolist()))
+
+
+def create_agents_from_GeoDataFrame(
+    agent_class: Type, model: mesa.Model, gdf: gpd.GeoDataFrame
+) -> List:
+    """
+    Same as mg.AgentCreator(agent_class, model=model).from_GeoDataFrame(gdf), but without building a pandas Series
+    for every row.
+    """
+    attributes = gdf.drop(columns=gdf.geometry.name).to_dict("records")
+    agents = []
+    for unique_id, geometry, row in zip(
+        gdf.index.tolist(), gdf.geometry.values, attributes
+    ):
+        agent = agent_class(
+            unique_id=unique_id, model=model, geometry=geometry, crs=gdf.crs
+        )
+        for name, value in row.items():
+            setattr(agent, name, value)
+        agents.append(agent)
+    return agents
 
 
 # reference: https://gis.stackexchange.com/questions/367228/using-shapely-interpolate-to-evenly-re-sample-points-on-a-linestring-geodatafram
@@ -95,3 +128,15 @@ class UnitTransformer:
 
     def meter2degree(self, geom):
         return transform(self._meter2degree.transform, geom)
+
+
+def get_path_positions(
+    path_in_meters: LineString, distance: float, unit_transformer: UnitTransformer
+) -> np.ndarray:
+    """
+    Positions along a path, evenly spaced about `distance` meters apart, in the degree CRS of the unit transformer.
+    """
+    redistributed_path_in_meters = redistribute_vertices(path_in_meters, distance)
+    return np.asarray(
+        unit_transformer.meter2degree(redistributed_path_in_meters).coords
+    )
@@ -0,0 +1,45 @@
+/**
+ * A MapModule that also shows the density image that the server sends instead of per-agent markers for large
+ * populations.
+ */
+const DensityMapModule = function (view, zoom, map_width, map_height) {
+  // the Leaflet map is private to MapModule, so catch it when MapModule creates it
+  let map = null;
+  L.Map.addInitHook(function () {
+    if (map === null) {
+      map = this;
+    }
+  });
+  MapModule.call(this, view, zoom, map_width, map_height);
+
+  let densityOverlay = null;
+  const removeDensityOverlay = function () {
+    if (densityOverlay !== null) {
+      densityOverlay.remove();
+      densityOverlay = null;
+    }
+  };
+
+  const renderMap = this.render;
+  this.render = function (data) {
+    renderMap.call(this, data);
+    if (!data.density) {
+      removeDensityOverlay();
+      return;
+    }
+    // keep showing the previous image until the new one is loaded, so that the map does not flicker
+    const previousOverlay = densityOverlay;
+    densityOverlay = L.imageOverlay(data.density.url, data.density.bounds, {
+      interactive: false,
+    }).addTo(map);
+    if (previousOverlay !== null) {
+      densityOverlay.once("load", () => previousOverlay.remove());
+    }
+  };
+
+  const resetMap = this.reset;
+  this.reset = function () {
+    resetMap.call(this);
+    removeDensityOverlay();
+  };
+};
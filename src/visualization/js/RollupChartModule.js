@@ -0,0 +1,50 @@
+const RollupChartModule = function (series, canvas_width, canvas_height) {
+  const canvas = document.createElement("canvas");
+  Object.assign(canvas, {
+    width: canvas_width,
+    height: canvas_height,
+    style: "border:1px dotted",
+  });
+  const elements = document.getElementById("elements");
+  elements.appendChild(canvas);
+  const context = canvas.getContext("2d");
+
+  const datasets = series.map((s) => ({
+    label: s.Label,
+    borderColor: s.Color,
+    backgroundColor: s.Color,
+    pointRadius: 0,
+    data: [],
+  }));
+
+  const chart = new Chart(context, {
+    type: "line",
+    data: { labels: [], datasets: datasets },
+    options: {
+      responsive: true,
+      animation: false,
+      scales: {
+        x: { display: true, ticks: { maxTicksLimit: 11 } },
+        y: { display: true },
+      },
+    },
+  });
+
+  // Every frame carries the whole (bounded) window to draw, which replaces the previous one,
+  // instead of one more point to append.
+  this.render = (data) => {
+    chart.data.labels = data.labels;
+    for (let i = 0; i < data.values.length; i++) {
+      chart.data.datasets[i].data = data.values[i];
+    }
+    chart.update();
+  };
+
+  this.reset = () => {
+    chart.data.labels = [];
+    chart.data.datasets.forEach((dataset) => {
+      dataset.data = [];
+    });
+    chart.update();
+  };
+};
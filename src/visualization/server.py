@@ -1,8 +1,22 @@
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional
+
 import mesa
+import mesa_geo as mg
+import numpy as np
+import shapely
+import tornado.escape
+import tornado.ioloop
+import tornado.websocket
+from folium.utilities import image_to_url
+from mesa.visualization.ModularVisualization import SocketHandler
 
 from src.agent.building import Building
 from src.agent.commuter import Commuter
 from src.agent.geo_agents import Driveway, LakeAndRiver, Walkway
+from src.model.runner import BackgroundRunner
 
 
 class ClockElement(mesa.visualization.TextElement):
@@ -14,6 +28,351 @@ class ClockElement(mesa.visualization.TextElement):
         return f"Day {model.day}, {model.hour:02d}:{model.minute:02d}"
 
 
+class BackgroundSocketHandler(SocketHandler):
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] == "get_step":
+            runner = self.application.runner
+            if not self.application.model.running and not runner.is_alive:
+                self.write_message({"type": "end"})
+            else:
+                # the model is stepped by the runner; only sample its latest completed state
+                runner.start()
+                self.write_message(self.viz_state_message)
+        else:
+            super().on_message(message)
+
+
+class BackgroundModularServer(mesa.visualization.ModularServer):
+    """
+    A ModularServer whose model is stepped by a BackgroundRunner rather than by browser requests.
+
+    The browser still asks for frames at its own frame rate, but each request only renders the latest completed
+    step. Steps taken in between two requests are never rendered.
+    """
+
+    socket_handler = BackgroundSocketHandler
+    ticks_per_second: Optional[float]
+    runner: Optional[BackgroundRunner]
+
+    def __init__(
+        self,
+        model_cls,
+        visualization_elements,
+        name="Mesa Model",
+        model_params=None,
+        port=None,
+        ticks_per_second=None,
+    ):
+        self.ticks_per_second = ticks_per_second
+        self.runner = None
+        super().__init__(
+            model_cls, visualization_elements, name, model_params, port=port
+        )
+        # handlers added here take precedence over the default websocket handler
+        self.add_handlers(r".*", [(r"/ws", self.socket_handler)])
+
+    def reset_model(self):
+        if self.runner is not None:
+            self.runner.stop()
+            # the old model is dropped while it may still be running, e.g., with route prefetching workers
+            self.model.close()
+        super().reset_model()
+        self.runner = BackgroundRunner(
+            self.model, ticks_per_second=self.ticks_per_second
+        )
+
+    def render_model(self):
+        with self.runner.lock:
+            self.model.sync_commuter_positions()
+            return super().render_model()
+
+
+END_FRAME = json.dumps({"type": "end"})
+
+
+class BroadcastSocketHandler(SocketHandler):
+    """
+    A viewer of a BroadcastModularServer, which receives frames as the server pushes them and cannot step, reset or
+    change the shared model.
+    """
+
+    def open(self):
+        super().open()
+        self.application.viewers[self] = None
+
+    def on_close(self):
+        self.application.viewers.pop(self, None)
+
+    def on_message(self, message):
+        msg = tornado.escape.json_decode(message)
+        if msg["type"] == "reset" and self.application.latest_frame is not None:
+            # a newly opened page resets its elements: give it the latest frame rather than resetting the model
+            self.write_message(self.application.latest_frame)
+        # get_step requests are not needed, as frames are pushed, and parameters are shared by all viewers
+
+
+class BroadcastModularServer(BackgroundModularServer):
+    """
+    A BackgroundModularServer that shows one simulation to any number of viewers.
+
+    Each new step is rendered and serialized once, at most frames_per_second times per second, and the same frame is
+    pushed to every connected viewer. A viewer that has not received the previous frame yet skips the new one, so
+    that slow connections neither queue up frames nor hold back the others.
+    """
+
+    socket_handler = BroadcastSocketHandler
+    frames_per_second: float
+    viewers: Dict[
+        BroadcastSocketHandler, Optional[asyncio.Future]
+    ]  # viewer -> its pending write, if any
+    latest_frame: Optional[str]
+    frames_sent: int
+    frames_dropped: int
+    _latest_frame_steps: Optional[int]
+    _broadcast_callback: Optional[tornado.ioloop.PeriodicCallback]
+
+    def __init__(
+        self,
+        model_cls,
+        visualization_elements,
+        name="Mesa Model",
+        model_params=None,
+        port=None,
+        ticks_per_second=None,
+        frames_per_second=3.0,
+    ):
+        self.frames_per_second = frames_per_second
+        self.viewers = dict()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self._broadcast_callback = None
+        super().__init__(
+            model_cls,
+            visualization_elements,
+            name,
+            model_params,
+            port=port,
+            ticks_per_second=ticks_per_second,
+        )
+
+    def reset_model(self):
+        super().reset_model()
+        self.latest_frame = None
+        self._latest_frame_steps = None
+
+    def listen(self, port, *args, **kwargs):
+        server = super().listen(port, *args, **kwargs)
+        self.runner.start()
+        self._broadcast_callback = tornado.ioloop.PeriodicCallback(
+            self.broadcast, 1000 / self.frames_per_second
+        )
+        self._broadcast_callback.start()
+        return server
+
+    def broadcast(self) -> None:
+        steps = self.model.schedule.steps
+        if steps != self._latest_frame_steps:
+            self.latest_frame = json.dumps(
+                {"type": "viz_state", "data": self.render_model()}
+            )
+            self._latest_frame_steps = steps
+        elif (
+            not self.model.running
+            and not self.runner.is_alive
+            and self.latest_frame != END_FRAME
+        ):
+            self.latest_frame = END_FRAME
+        else:
+            return
+        for viewer, pending_write in list(self.viewers.items()):
+            if pending_write is not None and not pending_write.done():
+                self.frames_dropped += 1
+                continue
+            try:
+                self.viewers[viewer] = viewer.write_message(self.latest_frame)
+                self.frames_sent += 1
+            except tornado.websocket.WebSocketClosedError:
+                self.viewers.pop(viewer, None)
+
+
+class RollupChartModule(mesa.visualization.ChartModule):
+    """
+    A line chart that draws at most max_points points, however long the model runs.
+
+    The chart shows the raw values of each tick while they fit, then the hourly means and then the daily means of the
+    model's rollups. Once even those do not fit, only the latest max_points days are shown.
+    """
+
+    local_includes = ["RollupChartModule.js"]
+    local_dir = os.path.join(os.path.dirname(__file__), "js")
+
+    def __init__(
+        self,
+        series,
+        canvas_height=200,
+        canvas_width=500,
+        data_collector_name="datacollector",
+        max_points=500,
+    ):
+        super().__init__(series, canvas_height, canvas_width, data_collector_name)
+        self.max_points = max_points
+        self.js_code = (
+            f"elements.push(new RollupChartModule({json.dumps(self.series)}, "
+            f"{canvas_width}, {canvas_height}));"
+        )
+
+    def render(self, model):
+        model_vars = getattr(model, self.data_collector_name).model_vars
+        times = model_vars["time"]
+        if len(times) <= self.max_points:
+            values = [model_vars[s["Label"]] for s in self.series]
+        else:
+            rollup = next(
+                (r for r in model.rollups.values() if len(r) <= self.max_points),
+                model.rollups["day"],
+            )
+            times = rollup.times
+            values = [rollup.get_series(s["Label"]) for s in self.series]
+        return {
+            "labels": [
+                f"Day {t.days}, {t.seconds // 3600:02d}:{t.seconds % 3600 // 60:02d}"
+                for t in times[-self.max_points :]
+            ],
+            "values": [v[-self.max_points :] for v in values],
+        }
+
+
+class DensityMapModule(mg.visualization.MapModule):
+    """
+    A MapModule that draws commuters as one marker each while there are at most max_markers of them, and as a
+    density image otherwise.
+
+    The density image is rasterized on the server, with raster_size pixels along the longer side of the space, by
+    histogramming commuter positions per status. The color of a pixel mixes status_colors by the number of commuters
+    of each status in it, and its opacity grows with their total number, on a log scale. Pixels are square in the
+    CRS of the space, which Leaflet shows without distortion if it is Web Mercator (the default model CRS).
+    """
+
+    local_js_file = os.path.join(os.path.dirname(__file__), "js", "DensityMapModule.js")
+    status_colors: Dict[str, str]
+    max_markers: int
+    raster_size: int
+    _show_markers: bool
+
+    def __init__(
+        self,
+        portrayal_method=None,
+        view=None,
+        zoom=None,
+        map_width=500,
+        map_height=500,
+        status_colors=None,
+        max_markers=1000,
+        raster_size=256,
+    ):
+        super().__init__(portrayal_method, view, zoom, map_width, map_height)
+        # the same colors as agent_draw
+        self.status_colors = status_colors or {
+            "home": "#008000",
+            "work": "#0000FF",
+            "transport": "#FF0000",
+        }
+        self.max_markers = max_markers
+        self.raster_size = raster_size
+        self._show_markers = True
+        # inlined in the page, because local includes are served from the directory of mesa-geo's MapModule
+        with open(self.local_js_file) as js_file:
+            script = js_file.read()
+        if view is None and zoom is None:
+            view, zoom = "null", "null"
+        self.js_code = (
+            f"{script}\n"
+            f"elements.push(new DensityMapModule({view}, {zoom}, {map_width}, {map_height}));"
+        )
+
+    def render(self, model):
+        commuters = [
+            agent for agent in model.space.agents if isinstance(agent, Commuter)
+        ]
+        self._show_markers = len(commuters) <= self.max_markers
+        layers = self._render_layers(model)
+        return {
+            "layers": layers,
+            "agents": self._render_agents(model),
+            "density": (
+                None
+                if self._show_markers
+                else self._render_density(model, commuters, layers["total_bounds"])
+            ),
+        }
+
+    def _render_agents(self, model):
+        if self._show_markers:
+            return super()._render_agents(model)
+        # the same features as MapModule._render_agents, except for commuters, which the density image shows
+        features = []
+        for agent in model.space.agents:
+            if isinstance(agent, Commuter):
+                continue
+            properties = self.portrayal_method(agent) if self.portrayal_method else {}
+            portrayal = dict()
+            if (description := properties.pop("description", None)) is not None:
+                portrayal["popupProperties"] = description
+            if properties:
+                is_point = isinstance(agent.geometry, shapely.Point)
+                portrayal["pointToLayer" if is_point else "style"] = properties
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": shapely.geometry.mapping(
+                        agent.get_transformed_geometry(model.space.transformer)
+                    ),
+                    "properties": portrayal,
+                }
+            )
+        return {"type": "FeatureCollection", "features": features}
+
+    def _render_density(
+        self, model, commuters: List[Commuter], bounds: List[List[float]]
+    ) -> Dict:
+        x_min, y_min, x_max, y_max = model.space.total_bounds
+        x_extent, y_extent = max(x_max - x_min, 1e-9), max(y_max - y_min, 1e-9)
+        width = max(round(self.raster_size * min(x_extent / y_extent, 1.0)), 1)
+        height = max(round(self.raster_size * min(y_extent / x_extent, 1.0)), 1)
+
+        statuses = list(self.status_colors)
+        status_index = {status: i for i, status in enumerate(statuses)}
+        xy = shapely.get_coordinates([commuter.geometry for commuter in commuters])
+        status_codes = np.array(
+            [status_index.get(commuter.status, -1) for commuter in commuters]
+        )
+        columns = ((xy[:, 0] - x_min) / x_extent * width).astype(int).clip(0, width - 1)
+        # the first row of the image is the top of the map
+        rows = ((y_max - xy[:, 1]) / y_extent * height).astype(int).clip(0, height - 1)
+        shown = status_codes >= 0
+        counts = np.bincount(
+            (status_codes * height + rows)[shown] * width + columns[shown],
+            minlength=len(statuses) * height * width,
+        ).reshape(len(statuses), height, width)
+
+        total = counts.sum(axis=0)
+        colors = np.array(
+            [
+                [int(color[i : i + 2], 16) for i in (1, 3, 5)]
+                for color in self.status_colors.values()
+            ]
+        )
+        rgb = (
+            np.tensordot(counts, colors, axes=(0, 0)) / np.maximum(total, 1)[..., None]
+        )
+        alpha = np.where(
+            total > 0, 0.4 + 0.6 * np.log1p(total) / np.log1p(max(total.max(), 1)), 0.0
+        )
+        image = np.dstack([rgb, 255 * alpha]).round().astype(np.uint8)
+        return {"url": image_to_url(image), "bounds": bounds}
+
+
 def agent_draw(agent):
     portrayal = dict()
     portrayal["color"] = "White"
@@ -48,7 +407,7 @@ def agent_draw(agent):
 
 
 clock_element = ClockElement()
-status_chart = mesa.visualization.ChartModule(
+status_chart = RollupChartModule(
     [
         {"Label": "status_home", "Color": "Green"},
         {"Label": "status_work", "Color": "Blue"},
@@ -56,7 +415,7 @@ status_chart = mesa.visualization.ChartModule(
     ],
     data_collector_name="datacollector",
 )
-friendship_chart = mesa.visualization.ChartModule(
+friendship_chart = RollupChartModule(
     [
         {"Label": "friendship_home", "Color": "Green"},
         {"Label": "friendship_work", "Color": "Blue"},
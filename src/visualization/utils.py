@@ -1,29 +1,96 @@
 import datetime
+from typing import List
 
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
+from src.model.rollup import ROLLUP_BUCKETS
 
-def plot_commuter_status_count(model_vars_df: pd.DataFrame) -> None:
-    commuter_status_df = model_vars_df.rename(
+MAX_PLOT_POINTS = 1000
+
+
+def get_model_vars_dataframe(model, max_points=MAX_PLOT_POINTS) -> pd.DataFrame:
+    """
+    Model-level series at the finest resolution, from raw ticks to the model's hourly and daily rollups, that has
+    no more than max_points rows.
+    """
+    if len(model.datacollector.model_vars["time"]) <= max_points:
+        return model.datacollector.get_model_vars_dataframe()
+    for rollup in model.rollups.values():
+        if len(rollup) <= max_points:
+            return rollup.to_dataframe()
+    return model.rollups["day"].to_dataframe().tail(max_points)
+
+
+def rollup_model_vars(model_vars_df: pd.DataFrame, max_points=MAX_PLOT_POINTS):
+    """
+    Roll up raw per-tick model variables into min/mean/max per hour or per day, whichever is the finest
+    resolution with no more than max_points rows. Data that is small enough, or already rolled up (as marked by its
+    attrs["rollup_bucket"], like TimeRollup.to_dataframe), is returned as is.
+    """
+    if len(model_vars_df) <= max_points or "rollup_bucket" in model_vars_df.attrs:
+        return model_vars_df
+    bucket = next(
+        (
+            b
+            for b in ROLLUP_BUCKETS.values()
+            if (model_vars_df["time"].iloc[-1] - model_vars_df["time"].iloc[0]) / b
+            < max_points
+        ),
+        ROLLUP_BUCKETS["day"],
+    )
+    grouped = model_vars_df.groupby((model_vars_df["time"] // bucket) * bucket)
+    rolled_up = grouped.mean().drop(columns="time")
+    rolled_up = rolled_up.join(grouped.min().drop(columns="time"), rsuffix="_min")
+    rolled_up = rolled_up.join(grouped.max().drop(columns="time"), rsuffix="_max")
+    rolled_up = rolled_up.rename_axis("time").reset_index().tail(max_points)
+    rolled_up.attrs["rollup_bucket"] = bucket
+    return rolled_up
+
+
+def _plot_min_max_bands(df: pd.DataFrame, value_vars: List[str], palette) -> None:
+    import matplotlib.pyplot as plt
+
+    if "rollup_bucket" not in df.attrs:
+        return
+    for var in value_vars:
+        plt.fill_between(
+            df["time"],
+            df[f"{var}_min"],
+            df[f"{var}_max"],
+            color=palette[var],
+            alpha=0.2,
+            linewidth=0,
+        )
+
+
+def plot_commuter_status_count(
+    model_vars_df: pd.DataFrame, max_points=MAX_PLOT_POINTS
+) -> None:
+    # plotting libraries are slow to import, and only needed here
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    commuter_status_df = rollup_model_vars(model_vars_df, max_points).rename(
         columns=lambda x: x.replace("status_", "")
     )
     commuter_status_df["time"] = commuter_status_df["time"] / pd.Timedelta(minutes=1)
-    commuter_status_df = commuter_status_df.melt(
-        id_vars=["time"],
-        value_vars=["home", "traveling", "work"],
-        var_name="status",
-        value_name="count",
-    )
+    value_vars = ["home", "traveling", "work"]
+    palette = dict(zip(value_vars, sns.color_palette(n_colors=len(value_vars))))
     sns.relplot(
         x="time",
         y="count",
-        data=commuter_status_df,
+        data=commuter_status_df.melt(
+            id_vars=["time"],
+            value_vars=value_vars,
+            var_name="status",
+            value_name="count",
+        ),
         kind="line",
         hue="status",
+        palette=palette,
         aspect=1.5,
     )
+    _plot_min_max_bands(commuter_status_df, value_vars, palette)
     plt.gca().xaxis.set_major_formatter(
         lambda x, pos: ":".join(str(datetime.timedelta(minutes=x)).split(":")[:2])
     )
@@ -31,23 +98,34 @@ def plot_commuter_status_count(model_vars_df: pd.DataFrame) -> None:
     plt.title("Number of commuters by status")
 
 
-def plot_num_friendships(model_vars_df: pd.DataFrame) -> None:
-    friendship_df = model_vars_df.rename(columns=lambda x: x.replace("friendship_", ""))
-    friendship_df["time"] = friendship_df["time"] / pd.Timedelta(minutes=1)
-    friendship_df = friendship_df.melt(
-        id_vars=["time"],
-        value_vars=["home", "work"],
-        var_name="friendship",
-        value_name="count",
+def plot_num_friendships(
+    model_vars_df: pd.DataFrame, max_points=MAX_PLOT_POINTS
+) -> None:
+    # plotting libraries are slow to import, and only needed here
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    friendship_df = rollup_model_vars(model_vars_df, max_points).rename(
+        columns=lambda x: x.replace("friendship_", "")
     )
+    friendship_df["time"] = friendship_df["time"] / pd.Timedelta(minutes=1)
+    value_vars = ["home", "work"]
+    palette = dict(zip(value_vars, sns.color_palette(n_colors=len(value_vars))))
     sns.relplot(
         x="time",
         y="count",
-        data=friendship_df,
+        data=friendship_df.melt(
+            id_vars=["time"],
+            value_vars=value_vars,
+            var_name="friendship",
+            value_name="count",
+        ),
         kind="line",
         hue="friendship",
+        palette=palette,
         aspect=1.5,
     )
+    _plot_min_max_bands(friendship_df, value_vars, palette)
     plt.gca().xaxis.set_major_formatter(
         lambda x, pos: ":".join(str(datetime.timedelta(minutes=x)).split(":")[:2])
     )